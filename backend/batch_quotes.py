@@ -0,0 +1,59 @@
+"""
+Batch quote extraction CLI for seeding reading lists.
+
+Usage:
+    python batch_quotes.py titles.txt -o quotes.json --batch-size 5 --workers 4
+
+`titles.txt` holds one book title per line. Each title is searched, then the
+contexts are packed `--batch-size` at a time into a single DeepSeek request.
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.search_service import search_book_info
+from services.llm_service import extract_quotes_batch_with_stats
+from services.book_index_service import resolve_book, has_title_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract quotes for many books in batched LLM calls.")
+    parser.add_argument("titles_file", help="Text file with one book title per line")
+    parser.add_argument("-o", "--output", default="quotes.json", help="Where to write the {title: quotes} JSON")
+    parser.add_argument("--batch-size", type=int, default=5, help="Books packed into one LLM request")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum concurrent searches / LLM requests")
+    args = parser.parse_args()
+
+    with open(args.titles_file, "r", encoding="utf-8") as f:
+        requested = [line.strip() for line in f if has_title_text(line)]
+
+    # Title variants of the same book are only searched and extracted once
+    refs = {title: resolve_book(title) for title in requested}
+    titles = list(dict.fromkeys(ref.title for ref in refs.values()))
+
+    start = time.time()
+    print(f"1. Searching info for {len(titles)} books...")
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        contexts = list(executor.map(search_book_info, titles))
+
+    print(f"2. Extracting quotes in batches of {args.batch_size}...")
+    results, stats = extract_quotes_batch_with_stats(list(zip(titles, contexts)), args.batch_size, args.workers)
+    results = {title: results.get(ref.title, []) for title, ref in refs.items()}
+    elapsed = time.time() - start
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    books = max(1, stats["books"])
+    print(f"Done: {stats['books']} books in {elapsed:.1f}s ({stats['books'] / elapsed * 60:.1f} books/min)")
+    print(f"Batch requests: {stats['batch_requests']}, fallbacks to single calls: {stats['fallbacks']}")
+    print(f"Batch tokens per book: {stats['batch_tokens'] / books:.0f}")
+
+
+if __name__ == "__main__":
+    main()
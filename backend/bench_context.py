@@ -0,0 +1,73 @@
+"""
+Benchmark for search context distillation.
+
+Usage:
+    python bench_context.py sample_titles.txt [--with-llm] [--fixtures fixtures.json]
+
+For each title, compares the raw concatenated search results (the old behaviour)
+with the distilled context: estimated prompt tokens and, with --with-llm, the
+quotes DeepSeek extracts from each so quality can be checked side by side.
+Raw results are saved to / loaded from --fixtures so reruns use the same sample set.
+"""
+import argparse
+import json
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.context_service import distill_context, estimate_tokens
+
+
+def raw_context(results: list[dict]) -> str:
+    return "".join(f"Title: {r['title']}\nSummary: {r['body']}\n\n" for r in results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("titles_file")
+    parser.add_argument("--fixtures", default="context_fixtures.json")
+    parser.add_argument("--with-llm", action="store_true", help="Also extract quotes from both contexts")
+    args = parser.parse_args()
+
+    with open(args.titles_file, "r", encoding="utf-8") as f:
+        titles = [line.strip() for line in f if line.strip()]
+
+    fixtures = {}
+    if os.path.exists(args.fixtures):
+        with open(args.fixtures, "r", encoding="utf-8") as f:
+            fixtures = json.load(f)
+
+    missing = [t for t in titles if t not in fixtures]
+    if missing:
+        from services.search_service import search_book_results
+        for title in missing:
+            fixtures[title] = search_book_results(title)
+        with open(args.fixtures, "w", encoding="utf-8") as f:
+            json.dump(fixtures, f, ensure_ascii=False, indent=2)
+
+    total_raw, total_distilled = 0, 0
+    for title in titles:
+        raw = raw_context(fixtures[title])
+        distilled = distill_context(title, fixtures[title])
+        raw_tokens, distilled_tokens = estimate_tokens(raw), estimate_tokens(distilled)
+        total_raw += raw_tokens
+        total_distilled += distilled_tokens
+        print(f"《{title}》 raw={raw_tokens} distilled={distilled_tokens} ({distilled_tokens / max(1, raw_tokens):.0%})")
+
+        if args.with_llm:
+            from services.llm_service import extract_quotes
+            print("  raw quotes:")
+            for q in extract_quotes(title, raw):
+                print(f"    - {q}")
+            print("  distilled quotes:")
+            for q in extract_quotes(title, distilled):
+                print(f"    - {q}")
+
+    print(f"Total estimated prompt tokens: raw={total_raw} distilled={total_distilled} "
+          f"(-{1 - total_distilled / max(1, total_raw):.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark native (Python) vs Chromium (markmap-cli + Puppeteer) mind map rendering.
+
+Usage:
+    python bench_mindmap_render.py mindmap.md [--runs 10] [--chromium]
+
+Reports renders per second and peak memory for each renderer. The Chromium run
+measures the peak RSS of the Node/Chrome child processes.
+"""
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from services.mindmap_renderer import render_mindmap_files
+
+
+def bench_native(markdown: str, out_dir: str, runs: int):
+    start = time.perf_counter()
+    for i in range(runs):
+        render_mindmap_files(
+            markdown, "思维导图",
+            jpg_path=os.path.join(out_dir, f"native_{i}.jpg"),
+            pdf_path=os.path.join(out_dir, f"native_{i}.pdf"),
+        )
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"native:   {runs / elapsed:.2f} renders/s, {elapsed / runs * 1000:.0f} ms/render, peak RSS {peak_mb:.0f} MB (this process)")
+
+
+def bench_chromium(markdown: str, out_dir: str, runs: int):
+    from services.document_service import _render_with_puppeteer
+    import subprocess
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    md_path = os.path.join(out_dir, "bench.md")
+    with open(md_path, "w", encoding="utf-8") as f:
+        f.write(markdown)
+
+    start = time.perf_counter()
+    for i in range(runs):
+        html_path = os.path.join(out_dir, f"chromium_{i}.html")
+        subprocess.run(["npx", "markmap-cli", md_path, "-o", html_path, "--no-open"], check=True, cwd=base_dir, capture_output=True)
+        _render_with_puppeteer(
+            base_dir, out_dir, html_path,
+            os.path.join(out_dir, f"chromium_{i}.jpg"), os.path.join(out_dir, f"chromium_{i}.pdf"), i,
+        )
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"chromium: {runs / elapsed:.2f} renders/s, {elapsed / runs * 1000:.0f} ms/render, peak RSS {peak_mb:.0f} MB (largest child)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("markdown_file")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--chromium", action="store_true", help="Also benchmark the Node/Puppeteer path")
+    args = parser.parse_args()
+
+    with open(args.markdown_file, "r", encoding="utf-8") as f:
+        markdown = f.read()
+
+    out_dir = tempfile.mkdtemp(prefix="mindmap_bench_")
+    try:
+        bench_native(markdown, out_dir, args.runs)
+        if args.chromium:
+            bench_chromium(markdown, out_dir, max(1, args.runs // 5))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
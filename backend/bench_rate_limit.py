@@ -0,0 +1,51 @@
+"""
+Micro-benchmark for the rate limiter's hot path.
+
+Usage:
+    python bench_rate_limit.py [--checks 200000] [--keys 10000] [--threads 8]
+
+Reports the mean cost of TokenBucketLimiter.check() single-threaded and under
+concurrent load from several threads.
+"""
+import argparse
+import random
+import threading
+import time
+
+from services.rate_limit_service import TokenBucketLimiter
+
+
+def run(limiter: TokenBucketLimiter, keys: list[str], checks: int):
+    for i in range(checks):
+        limiter.check(keys[i % len(keys)])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checks", type=int, default=200000)
+    parser.add_argument("--keys", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    keys = [f"10.{random.randint(0, 255)}.{random.randint(0, 255)}.{i % 256}" for i in range(args.keys)]
+
+    limiter = TokenBucketLimiter(rate_per_minute=20, burst=10)
+    start = time.perf_counter()
+    run(limiter, keys, args.checks)
+    elapsed = time.perf_counter() - start
+    print(f"single thread: {elapsed / args.checks * 1e6:.2f} µs/check")
+
+    limiter = TokenBucketLimiter(rate_per_minute=20, burst=10)
+    per_thread = args.checks // args.threads
+    threads = [threading.Thread(target=run, args=(limiter, keys[i::args.threads], per_thread)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    print(f"{args.threads} threads:     {elapsed / (per_thread * args.threads) * 1e6:.2f} µs/check (wall clock)")
+
+
+if __name__ == "__main__":
+    main()
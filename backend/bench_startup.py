@@ -0,0 +1,77 @@
+"""
+Startup benchmark: import cost of `main` and time until the first HTTP response.
+
+Usage:
+    python bench_startup.py [--runs 3] [--top 15]
+
+Import times come from `python -X importtime -c "import main"` (cumulative
+microseconds per top-level module); time-to-first-response launches uvicorn
+and polls GET / until it answers.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(top: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # Format: "import time: <self us> | <cumulative us> | <indented module name>"
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.rstrip()))
+    # Only top-level entries (a single leading space) add up to the total
+    top_level = [(us, name) for us, name in rows if not name.startswith("  ")]
+    total = sum(us for us, _ in top_level)
+    print(f"import main: {total / 1000:.0f} ms cumulative")
+    for us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {us / 1000:8.1f} ms  {name.strip()}")
+
+
+def time_to_first_response(port: int) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=0.5).read()
+                return time.perf_counter() - start
+            except Exception:
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited before answering")
+                if time.perf_counter() - start > 60:
+                    raise RuntimeError("No response within 60s")
+                time.sleep(0.02)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    import_times(args.top)
+    timings = [time_to_first_response(args.port) for _ in range(args.runs)]
+    print(f"time to first response: best {min(timings) * 1000:.0f} ms, "
+          f"mean {sum(timings) / len(timings) * 1000:.0f} ms over {args.runs} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,12 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-import uvicorn
+from pydantic import BaseModel, Field
 import os
 from dotenv import load_dotenv
 import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 
@@ -15,21 +16,36 @@ mimetypes.add_type("text/html", ".html")
 mimetypes.add_type("application/pdf", ".pdf")
 mimetypes.add_type("image/jpeg", ".jpg")
 mimetypes.add_type("text/markdown", ".md")
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("application/vnd.xmind.workbook", ".xmind")
+mimetypes.add_type("text/x-opml", ".opml")
 
 from services.search_service import search_book_info
-from services.llm_service import extract_quotes, generate_core_thought, generate_mindmap_markdown
+from services.llm_service import extract_quotes_batch
+from services.analysis_service import get_book_analysis
+from services.book_index_service import resolve_book, has_title_text
+from services import llm_cache
 from services.image_service import generate_image
 from services.poster_service import create_poster_image
-from services.document_service import generate_mindmap_document
+from services.document_service import generate_mindmap_document, render_mindmap_export
+from services.mindmap_renderer import shutdown_render_pool
+from services.janitor_service import janitor_loop
+from services.rate_limit_service import rate_limit_ip, enforce_rate_limit, ip_limiter, client_ip, usage_flush_loop
 
-from database import engine, Base
-import models
 from routers.h5_api import router as h5_router
 
-app = FastAPI(title="Book Quote Generator API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema creation lives in `python migrate.py`; SDK clients are built on first use
+    janitor_task = asyncio.create_task(janitor_loop())
+    usage_flush_task = asyncio.create_task(usage_flush_loop())
+    yield
+    janitor_task.cancel()
+    usage_flush_task.cancel()
+    shutdown_render_pool()
 
-# Initialize SQLite database schema
-Base.metadata.create_all(bind=engine)
+app = FastAPI(title="Book Quote Generator API", lifespan=lifespan)
 
 # Include H5 App specialized router
 app.include_router(h5_router)
@@ -63,11 +79,35 @@ async def get_static_file(filename: str):
         mime_type = "application/pdf"
     elif filename.endswith(".jpg") or filename.endswith(".jpeg"):
         mime_type = "image/jpeg"
+    elif filename.endswith(".webp"):
+        mime_type = "image/webp"
+    elif filename.endswith(".avif"):
+        mime_type = "image/avif"
     elif filename.endswith(".md"):
         mime_type = "text/markdown"
+    elif filename.endswith(".xmind"):
+        mime_type = "application/vnd.xmind.workbook"
+    elif filename.endswith(".opml"):
+        mime_type = "text/x-opml"
         
     return FileResponse(file_path, media_type=mime_type)
 
+@app.get("/api/mindmap_export/{filename}")
+def get_mindmap_export(filename: str):
+    # Renders the JPG/PDF on first request, then serves the stored file
+    try:
+        file_path = render_mindmap_export(filename)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    except Exception as e:
+        print(f"Error rendering mindmap export: {e}")
+        raise HTTPException(status_code=500, detail="Export rendering failed")
+
+    mime_type = "application/pdf" if filename.endswith(".pdf") else "image/jpeg"
+    return FileResponse(file_path, media_type=mime_type, filename=filename)
+
 class GetQuotesRequest(BaseModel):
     book_title: str
 
@@ -75,6 +115,18 @@ class GetQuotesResponse(BaseModel):
     quotes: list[str]
     message: str
 
+# Each title costs three web searches, so batches are capped well below what the LLM could take
+MAX_BATCH_TITLES = 50
+MAX_BATCH_SIZE = 10
+
+class GetQuotesBatchRequest(BaseModel):
+    book_titles: list[str] = Field(max_length=MAX_BATCH_TITLES)
+    batch_size: int = 5
+
+class GetQuotesBatchResponse(BaseModel):
+    quotes: dict[str, list[str]]
+    message: str
+
 class GeneratePosterRequest(BaseModel):
     book_title: str
     selected_quotes: list[str]
@@ -84,6 +136,7 @@ class GeneratePosterResponse(BaseModel):
     poster_url: str
     image_url: str | None = None
     core_thought: str | None = None
+    renditions: dict[str, dict[str, str]] = {}
     message: str
 
 class GenerateMindmapRequest(BaseModel):
@@ -93,47 +146,80 @@ class GenerateMindmapResponse(BaseModel):
     pdf_url: str
     message: str
 
+def require_book_title(title: str):
+    # Titles without letters or digits (e.g. 《》) can't name a book or a cache key
+    if not has_title_text(title):
+        raise HTTPException(status_code=400, detail="Book title must contain letters or digits.")
+
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "Book Quote Generator API is running"}
 
-@app.post("/api/get_quotes", response_model=GetQuotesResponse)
+@app.get("/api/llm_cache/stats")
+def get_llm_cache_stats():
+    # Per-call hit rate and LLM seconds saved by the persistent response cache
+    return llm_cache.stats()
+
+@app.post("/api/get_quotes", response_model=GetQuotesResponse, dependencies=[Depends(rate_limit_ip)])
 async def get_quotes(request: GetQuotesRequest):
+    require_book_title(request.book_title)
     try:
-        print(f"1. Searching info for: {request.book_title}")
-        context = search_book_info(request.book_title)
-        
-        print(f"2. Extracting 10 quotes...")
-        quotes = extract_quotes(request.book_title, context)
+        print(f"1. Analyzing book: {request.book_title}")
+        quotes = get_book_analysis(request.book_title)["quotes"]
         
         return GetQuotesResponse(quotes=quotes, message="Success")
     except Exception as e:
         print(f"Error in fetching quotes: {e}")
         return GetQuotesResponse(quotes=[], message=f"Error: {e}")
 
-@app.post("/api/generate_poster", response_model=GeneratePosterResponse)
+@app.post("/api/get_quotes_batch", response_model=GetQuotesBatchResponse)
+def get_quotes_batch(request: GetQuotesBatchRequest, http_request: Request):
+    requested = list(dict.fromkeys(t for t in request.book_titles if t.strip()))
+    for title in requested:
+        require_book_title(title)
+    batch_size = max(1, min(request.batch_size, MAX_BATCH_SIZE))
+    # Each batched LLM request counts as one generation against the caller's rate limit.
+    # Charged before resolving titles, which may write to the book index.
+    enforce_rate_limit(ip_limiter, client_ip(http_request), cost=max(1, -(-len(requested) // batch_size)))
+    # Title variants of the same book ("人类简史", "《人类简史》") are searched and extracted once
+    refs = {title: resolve_book(title) for title in requested}
+    titles = list(dict.fromkeys(ref.title for ref in refs.values()))
+    try:
+        print(f"1. Searching info for {len(titles)} books...")
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            contexts = list(executor.map(search_book_info, titles))
+
+        print(f"2. Extracting quotes in batches of {batch_size}...")
+        quotes = extract_quotes_batch(list(zip(titles, contexts)), batch_size=batch_size)
+
+        return GetQuotesBatchResponse(quotes={title: quotes.get(ref.title, []) for title, ref in refs.items()}, message="Success")
+    except Exception as e:
+        print(f"Error in fetching batch quotes: {e}")
+        return GetQuotesBatchResponse(quotes={}, message=f"Error: {e}")
+
+@app.post("/api/generate_poster", response_model=GeneratePosterResponse, dependencies=[Depends(rate_limit_ip)])
 async def generate_poster(request: GeneratePosterRequest):
+    require_book_title(request.book_title)
     try:
         core_thought = None
         image_url = None
         
-        # Searching info again (in production this would be cached or passed along)
-        context = search_book_info(request.book_title)
-        
         if request.generate_image:
-            print(f"3a. Generating core thought from overall book context...")
-            core_thought = generate_core_thought(request.book_title, context)
+            # Reuses the analysis cached by /api/get_quotes, no search or LLM round trip
+            print(f"3a. Loading core thought from book analysis...")
+            core_thought = get_book_analysis(request.book_title)["core_thought"]
             
             print(f"3b. Generating background image based on core thought...")
             image_url = generate_image(core_thought)
         
         print(f"4. Creating poster...")
-        poster_local_path = await create_poster_image(request.book_title, request.selected_quotes, image_url)
+        poster_local_path, renditions = await create_poster_image(request.book_title, request.selected_quotes, image_url)
         
         return GeneratePosterResponse(
             poster_url=poster_local_path,
             image_url=image_url if request.generate_image else "",
             core_thought=core_thought if request.generate_image else "使用纯色纯文字排版。",
+            renditions=renditions,
             message="Success"
         )
     except Exception as e:
@@ -143,14 +229,12 @@ async def generate_poster(request: GeneratePosterRequest):
             message=f"Error generating poster: {str(e)}"
         )
 
-@app.post("/api/generate_mindmap", response_model=GenerateMindmapResponse)
+@app.post("/api/generate_mindmap", response_model=GenerateMindmapResponse, dependencies=[Depends(rate_limit_ip)])
 async def generate_mindmap(request: GenerateMindmapRequest):
+    require_book_title(request.book_title)
     try:
-        print(f"1. Searching info for Mindmap: {request.book_title}")
-        context = search_book_info(request.book_title)
-        
-        print(f"2. Generating Markdown structure...")
-        md_content = generate_mindmap_markdown(request.book_title, context)
+        print(f"1. Loading Markdown structure for Mindmap: {request.book_title}")
+        md_content = get_book_analysis(request.book_title)["mindmap_markdown"]
         
         print(f"3. Rendering Document using Markmap...")
         pdf_url = generate_mindmap_document(request.book_title, md_content)
@@ -161,4 +245,5 @@ async def generate_mindmap(request: GenerateMindmapRequest):
         return GenerateMindmapResponse(pdf_url="", message=str(e))
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
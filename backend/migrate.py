@@ -0,0 +1,11 @@
+"""
+Creates/updates the SQLite schema. Run once per deploy, before starting the workers:
+
+    python migrate.py
+"""
+from database import engine, Base
+import models  # noqa: F401  (registers the tables on Base.metadata)
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    print(f"Schema up to date: {', '.join(sorted(Base.metadata.tables))}")
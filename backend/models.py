@@ -22,6 +22,14 @@ class IPLog(Base):
     date = Column(Date, index=True, default=datetime.date.today)
     usage_count = Column(Integer, default=0)
 
+class Book(Base):
+    __tablename__ = "books"
+
+    id = Column(Integer, primary_key=True, index=True)
+    canonical_id = Column(String, unique=True, index=True)
+    title = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
 class Transaction(Base):
     __tablename__ = "transactions"
 
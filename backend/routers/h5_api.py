@@ -2,19 +2,19 @@ import datetime
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-import bcrypt
-import jwt
 
 from database import get_db
 import models
-from services.search_service import search_book_info
-from services.llm_service import generate_mindmap_markdown
+from services.analysis_service import get_book_analysis
+from services.rate_limit_service import client_ip, daily_usage, user_limiter, enforce_rate_limit, rate_limit_ip
 from services.document_service import generate_mindmap_document
+from services.book_index_service import has_title_text
 
 router = APIRouter(prefix="/api/h5", tags=["H5 Mini-Program"])
 
 SECRET_KEY = "h5_super_secret_key"
 ALGORITHM = "HS256"
+FREE_DAILY_QUOTA = 5
 
 # -- Schemas --
 class AuthRequest(BaseModel):
@@ -30,7 +30,7 @@ class UserInfoResponse(BaseModel):
     username: str
     generate_quota: int
     daily_free_used: int
-    daily_free_total: int = 5
+    daily_free_total: int = FREE_DAILY_QUOTA
 
 class PayRequest(BaseModel):
     amount_rmb: int = 5
@@ -44,13 +44,17 @@ class H5GenerateMindmapResponse(BaseModel):
     quota_used: str
 
 # -- Auth Utilities --
+# bcrypt and jwt are imported inside the helpers so they load on first use, not at startup
 def verify_password(plain_password, hashed_password):
+    import bcrypt
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def get_password_hash(password):
+    import bcrypt
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 def create_access_token(data: dict):
+    import jwt
     to_encode = data.copy()
     expire = datetime.datetime.utcnow() + datetime.timedelta(days=7)
     to_encode.update({"exp": expire})
@@ -58,6 +62,7 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 def get_current_user(request: Request, db: Session = Depends(get_db)):
+    import jwt
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -77,10 +82,7 @@ def get_current_user(request: Request, db: Session = Depends(get_db)):
     return user
 
 def get_ip(request: Request):
-    forwarded = request.headers.get("X-Forwarded-For")
-    if forwarded:
-        return forwarded.split(",")[0]
-    return request.client.host
+    return client_ip(request)
 
 # -- Endpoints --
 @router.post("/register", response_model=TokenResponse)
@@ -109,16 +111,13 @@ def login(req: AuthRequest, db: Session = Depends(get_db)):
 
 @router.get("/me", response_model=UserInfoResponse)
 def get_me(request: Request, user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    ip = get_ip(request)
-    today = datetime.date.today()
-    ip_log = db.query(models.IPLog).filter(models.IPLog.ip_address == ip, models.IPLog.date == today).first()
-    used = ip_log.usage_count if ip_log else 0
+    used = daily_usage.used(get_ip(request))
 
     return {
         "username": user.username,
         "generate_quota": user.generate_quota,
         "daily_free_used": used,
-        "daily_free_total": 5
+        "daily_free_total": FREE_DAILY_QUOTA
     }
 
 @router.post("/pay")
@@ -138,23 +137,17 @@ def mock_pay(req: PayRequest, user: models.User = Depends(get_current_user), db:
     db.commit()
     return {"message": f"Payment successful. Added {quota_to_add} to quota.", "new_quota": user.generate_quota}
 
-@router.post("/generate_mindmap", response_model=H5GenerateMindmapResponse)
+@router.post("/generate_mindmap", response_model=H5GenerateMindmapResponse, dependencies=[Depends(rate_limit_ip)])
 def h5_generate_mindmap(req: H5GenerateMindmapRequest, request: Request, user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    enforce_rate_limit(user_limiter, user.id)
+    # Checked before any quota is consumed
+    if not has_title_text(req.book_title):
+        raise HTTPException(status_code=400, detail="Book title must contain letters or digits.")
     ip = get_ip(request)
-    today = datetime.date.today()
-    
-    ip_log = db.query(models.IPLog).filter(models.IPLog.ip_address == ip, models.IPLog.date == today).first()
-    if not ip_log:
-        ip_log = models.IPLog(ip_address=ip, date=today, usage_count=0)
-        db.add(ip_log)
-        db.commit()
-        db.refresh(ip_log)
     
     quota_used_msg = ""
-    # Check free quota first
-    if ip_log.usage_count < 5:
-        ip_log.usage_count += 1
-        db.commit()
+    # Check free quota first (in-memory counter, flushed to IPLog in the background)
+    if daily_usage.try_consume(ip, FREE_DAILY_QUOTA):
         quota_used_msg = "free_daily_quota"
     # Fallback to paid quota
     elif user.generate_quota > 0:
@@ -166,17 +159,16 @@ def h5_generate_mindmap(req: H5GenerateMindmapRequest, request: Request, user: m
     
     # Actually generate the mindmap
     try:
-        context = search_book_info(req.book_title)
-        md_content = generate_mindmap_markdown(req.book_title, context)
+        md_content = get_book_analysis(req.book_title)["mindmap_markdown"]
         pdf_url = generate_mindmap_document(req.book_title, md_content)
     except Exception as e:
         # Rollback quota if generation fails?
         # For simplicity, we can just refund it.
         if quota_used_msg == "free_daily_quota":
-            ip_log.usage_count -= 1
+            daily_usage.refund(ip)
         elif quota_used_msg == "paid_quota":
             user.generate_quota += 1
-        db.commit()
+            db.commit()
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
         
     return H5GenerateMindmapResponse(pdf_url=pdf_url, message="Success", quota_used=quota_used_msg)
@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict
+
+from services.search_service import search_book_info
+from services.llm_service import analyze_book
+from services.book_index_service import resolve_book
+from services import llm_cache
+
+# In-process cache of combined book analyses, shared by every endpoint so that
+# quotes -> poster -> mind map for the same book costs a single LLM round trip.
+# Keyed by canonical book id, so title variants share one entry. Entries older than
+# the book's last `llm_cache.invalidate_book` (from any process) are discarded.
+MAX_CACHED_BOOKS = 256
+
+# canonical id -> (cached at, analysis)
+_analysis_cache: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def get_book_analysis(book_title: str) -> dict:
+    """
+    Returns {"quotes", "core_thought", "mindmap_markdown"} for the book, searching
+    and calling the LLM only on the first request for that book.
+    """
+    ref = resolve_book(book_title)
+    with _cache_lock:
+        cached = _analysis_cache.get(ref.canonical_id)
+        if cached is not None:
+            _analysis_cache.move_to_end(ref.canonical_id)
+    if cached is not None:
+        cached_at, analysis = cached
+        if cached_at > llm_cache.invalidated_at(ref.canonical_id):
+            print(f"Using cached analysis for: {ref.title}")
+            return analysis
+        print(f"Cached analysis for {ref.title} was invalidated, regenerating")
+        with _cache_lock:
+            if _analysis_cache.get(ref.canonical_id) is cached:
+                del _analysis_cache[ref.canonical_id]
+
+    started_at = time.time()
+    print(f"Searching info for: {ref.title}")
+    context = search_book_info(ref.title)
+
+    print(f"Generating combined analysis (quotes, core thought, mind map)...")
+    analysis = analyze_book(ref.title, context)
+
+    if analysis["fallback"]:
+        # Don't pin placeholder text from an LLM outage; the next request retries
+        print(f"Not caching fallback analysis for: {ref.title}")
+        return analysis
+
+    with _cache_lock:
+        # Stamped with the start time, so an invalidation during generation still wins
+        _analysis_cache[ref.canonical_id] = (started_at, analysis)
+        _analysis_cache.move_to_end(ref.canonical_id)
+        while len(_analysis_cache) > MAX_CACHED_BOOKS:
+            _analysis_cache.popitem(last=False)
+    return analysis
@@ -0,0 +1,231 @@
+"""
+Canonical book index. Titles are folded to a canonical id (Unicode-normalized,
+simplified characters, no punctuation/brackets/whitespace) so that 人类简史,
+《人类简史》 and 人類簡史 share every cache entry and generated file.
+"""
+import difflib
+import hashlib
+import re
+import threading
+import unicodedata
+from typing import NamedTuple
+
+# Titles this close (difflib ratio on canonical keys) are treated as the same book
+FUZZY_CUTOFF = 0.9
+# Very short titles are too easy to confuse ("活着" vs "活法"), so they must match exactly
+FUZZY_MIN_LENGTH = 5
+MAX_KEY_LENGTH = 60
+# Characters that tell volumes of a series apart; titles differing in any of these
+# (or in digits/numerals) are different books however similar the rest is
+_VOLUME_CHARS = set("上中下前后续卷册部集篇季")
+_ROMAN_CHARS = set("ivxl")
+
+# Opening -> closing pairs stripped when they wrap the whole title (after NFKC, so （） is ())
+_BRACKET_PAIRS = {"《": "》", "〈": "〉", "<": ">", "「": "」", "『": "』", "“": "”", "‘": "’", "【": "】", "[": "]", "(": ")", '"': '"', "'": "'"}
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Common traditional -> simplified characters, used when OpenCC isn't installed
+_TRADITIONAL = (
+    "簡體國華書經濟學歷論語說話讀寫詩詞記傳紅樓夢遊義東島風雲龍鳳馬鳥魚門開關間問聞時長張來們個這萬與為無愛親戀歡樂聲藝術機電"
+    "腦網絡發現實驗觀點變營銷資產業價窮貴財貧錢銀戰爭軍勝敗權勢將帥處從眾會議認識讓謂輕對錯難離雜雖聖靈禪內兩亂後覺瘋險陰陽憶"
+    "懷戲劇畫場壞塵壓動勞務勵單嚴員圓團圖奮婦嬰孫寧審導屬歲師帶幫幾廣廳彈徵憂應戶擁據擇擊敵數斷舊晝曉極構標樹橋檢歸殺氣決沒滅"
+    "漢濃灣熱燈爾獨獵環療盡監盤確禮種稱穩筆節範築簽糧紀約級紙細終組結給統絲綠維綜線編練總績續罰羅聯聽職腳興舉艱莊葉蘇蘭號蟲衛"
+    "補裝複見規視覽計訊討訓許設證評試詳誌誠誤課調談請諸謝謎譜護讚豐貓負貨質購賽贈趕趨躍車軟轉輪辦農連進運過達遠適選遺邊鄉鄰醫"
+    "釋針鐵錄鍵鏡閱陳陸隊階際隨隱雙雞靜韓頁頂項順須頭題顏願類顧顯飛飯館驚髮鬥鹽麗麥黃齊齒龜億優儲兒創劍勁區協卻參吳嗎嘆噴嚮園"
+    "堅報塊夠奪媽寶尋層岡幣庫廢徑復態慣慶憐懼揮損換攝敘斬於曆條楊樣歐殘湯溫滿漁潔澤濕烏煙爺牆犧狀獅獻瑪畢異當睜礎祕禍穀窩競簾"
+    "紋純紐綱緣縣繩繪罷習肅脈腸膽臉臨藥蘋虛蝦蠶襪襲觸訂託詢該誰諾豈貝貞費賀賓賴贊趙跡踐蹤軌較輔輩辭遲邏鄭醜釣鈴銅鋼錦鍋鐘鑰閃"
+    "閒闊陣隸雛霧響頻頓領頗顆飄飽養餘騎鬆魯鮮鯨鳴鴻鵝鶴鷹麼黨齡龐禦瓊蓋貳歎紳鄧禱瀋燦穫獲盜倉侶偉偵傘備傷傾僅儀兇冊凱則剛剝劃"
+    "劉勳匯厲厭叢啟喪喬嗚嚇囑圍塗墜壇壯壺夾奧妝娛婁嫻孿宮寢專尷屆峽崗嶺巖帳幟廟廠強彥徹恆惡惱慚慘慮憑憤憲懇懶拋挾捨掃掛採揚擔"
+    "擬擴擺攜斃晉暈暢暫曬朧枴棄棟楓榮槍樁欄殲毀氈汙測渾湧準滄滯漲潛濤瀟灑灘災煉熾燒燭爐牽犢猶獄瑣甦畝疊瘡癡睏矯碼磚礙祿稅稈窺"
+    "竄籃籠粵糾紗紡紮絕絞綁綢緊緒緩縫縮繃繼纏缽罈羨聳脅脫腎膠膩艦薦薩藍蘆虧蛻蝕螢蠻衝袞裡製褲訴詐詭誇誕誦謀謊謹譯豎豬賊賜賠賤"
+    "賦賭贏蹟軀載輝輸轟辯迴週遜遞遙還邁醞醬釀鈔鉤銳鋒鍛鎖鎮鏈鐮鑄鑒閉閣闆闖陝隴靂韻頌預頸顛颯飢餅餓饑馳駐駕駛騙騰驅驕驟鬱鱗鳩"
+    "鴉鴨鶯鸚麵黴鼴齋"
+)
+_SIMPLIFIED = (
+    "简体国华书经济学历论语说话读写诗词记传红楼梦游义东岛风云龙凤马鸟鱼门开关间问闻时长张来们个这万与为无爱亲恋欢乐声艺术机电"
+    "脑网络发现实验观点变营销资产业价穷贵财贫钱银战争军胜败权势将帅处从众会议认识让谓轻对错难离杂虽圣灵禅内两乱后觉疯险阴阳忆"
+    "怀戏剧画场坏尘压动劳务励单严员圆团图奋妇婴孙宁审导属岁师带帮几广厅弹征忧应户拥据择击敌数断旧昼晓极构标树桥检归杀气决没灭"
+    "汉浓湾热灯尔独猎环疗尽监盘确礼种称稳笔节范筑签粮纪约级纸细终组结给统丝绿维综线编练总绩续罚罗联听职脚兴举艰庄叶苏兰号虫卫"
+    "补装复见规视览计讯讨训许设证评试详志诚误课调谈请诸谢谜谱护赞丰猫负货质购赛赠赶趋跃车软转轮办农连进运过达远适选遗边乡邻医"
+    "释针铁录键镜阅陈陆队阶际随隐双鸡静韩页顶项顺须头题颜愿类顾显飞饭馆惊发斗盐丽麦黄齐齿龟亿优储儿创剑劲区协却参吴吗叹喷向园"
+    "坚报块够夺妈宝寻层冈币库废径复态惯庆怜惧挥损换摄叙斩于历条杨样欧残汤温满渔洁泽湿乌烟爷墙牺状狮献玛毕异当睁础秘祸谷窝竞帘"
+    "纹纯纽纲缘县绳绘罢习肃脉肠胆脸临药苹虚虾蚕袜袭触订托询该谁诺岂贝贞费贺宾赖赞赵迹践踪轨较辅辈辞迟逻郑丑钓铃铜钢锦锅钟钥闪"
+    "闲阔阵隶雏雾响频顿领颇颗飘饱养余骑松鲁鲜鲸鸣鸿鹅鹤鹰么党龄庞御琼盖贰叹绅邓祷沈灿获获盗仓侣伟侦伞备伤倾仅仪凶册凯则刚剥划"
+    "刘勋汇厉厌丛启丧乔呜吓嘱围涂坠坛壮壶夹奥妆娱娄娴孪宫寝专尴届峡岗岭岩帐帜庙厂强彦彻恒恶恼惭惨虑凭愤宪恳懒抛挟舍扫挂采扬担"
+    "拟扩摆携毙晋晕畅暂晒胧拐弃栋枫荣枪桩栏歼毁毡污测浑涌准沧滞涨潜涛潇洒滩灾炼炽烧烛炉牵犊犹狱琐苏亩叠疮痴困矫码砖碍禄税秆窥"
+    "窜篮笼粤纠纱纺扎绝绞绑绸紧绪缓缝缩绷继缠钵坛羡耸胁脱肾胶腻舰荐萨蓝芦亏蜕蚀萤蛮冲衮里制裤诉诈诡夸诞诵谋谎谨译竖猪贼赐赔贱"
+    "赋赌赢迹躯载辉输轰辩回周逊递遥还迈酝酱酿钞钩锐锋锻锁镇链镰铸鉴闭阁板闯陕陇雳韵颂预颈颠飒饥饼饿饥驰驻驾驶骗腾驱骄骤郁鳞鸠"
+    "鸦鸭莺鹦面霉鼹斋"
+)
+_T2S = str.maketrans(_TRADITIONAL, _SIMPLIFIED)
+
+_opencc = None
+
+def _to_simplified(text: str) -> str:
+    global _opencc
+    if _opencc is None:
+        try:
+            import opencc
+            _opencc = opencc.OpenCC("t2s")
+        except Exception:
+            _opencc = False
+    if _opencc:
+        return _opencc.convert(text)
+    return text.translate(_T2S)
+
+def _wrapped_in_brackets(text: str) -> bool:
+    """True when the first character opens a bracket pair closed by the last one."""
+    opening, closing = text[0], _BRACKET_PAIRS.get(text[0])
+    if closing is None or text[-1] != closing:
+        return False
+    if opening == closing:
+        return closing not in text[1:-1]
+    depth = 0
+    for i, ch in enumerate(text):
+        if ch == opening:
+            depth += 1
+        elif ch == closing:
+            depth -= 1
+            if depth == 0 and i < len(text) - 1:
+                return False
+    return True
+
+def clean_title(title: str) -> str:
+    """Display form: NFKC-normalized, trimmed, surrounding 《》/quotes/brackets removed."""
+    text = _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", title)).strip()
+    while len(text) > 2 and _wrapped_in_brackets(text):
+        text = text[1:-1].strip()
+    return text
+
+def _letters_and_digits(text: str) -> str:
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] in ("L", "N"))
+
+def has_title_text(title: str) -> bool:
+    """False for titles made only of punctuation, brackets or whitespace."""
+    return bool(_letters_and_digits(unicodedata.normalize("NFKC", title)))
+
+def normalize_title(title: str) -> str:
+    """
+    Canonical id for a book title: NFKC, simplified characters, lowercase, and only
+    letters/digits kept, so 《人類簡史》, " 人类简史 " and 人类简史 all map to 人类简史.
+    The result contains no punctuation or path separators and is safe in filenames.
+    """
+    text = _to_simplified(unicodedata.normalize("NFKC", title)).lower()
+    key = _letters_and_digits(text)
+    if not key:
+        # No letters or digits (endpoints reject these via has_title_text): hash the
+        # punctuation itself so e.g. 《》 and “” still get different ids
+        symbols = _WHITESPACE_RE.sub("", text)
+        return f"book_{hashlib.sha1(symbols.encode('utf-8')).hexdigest()[:12]}"
+    if len(key) > MAX_KEY_LENGTH:
+        return f"{key[:MAX_KEY_LENGTH - 9]}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]}"
+    return key
+
+def _is_volume_difference(a: str, b: str) -> bool:
+    """True when the keys differ in a digit, numeral, volume marker or trailing roman numeral."""
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op == "equal":
+            continue
+        changed = a[i1:i2] + b[j1:j2]
+        if any(ch.isnumeric() or ch in _VOLUME_CHARS for ch in changed):
+            return True
+        if (i2 == len(a) or j2 == len(b)) and set(changed) <= _ROMAN_CHARS:
+            return True
+    return False
+
+class BookRef(NamedTuple):
+    canonical_id: str
+    title: str
+
+class BookIndex:
+    """
+    Maps requested titles onto canonical books. Exact canonical-id matches win;
+    otherwise the closest known id within FUZZY_CUTOFF is used, and unknown titles
+    are registered (in memory and in the `books` table, so all workers share them).
+    """
+
+    def __init__(self):
+        self._titles: dict[str, str] = {}
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Loads books registered since the last refresh (possibly by other workers)."""
+        from database import SessionLocal
+        import models
+
+        # Query without holding the index lock; lookups of known books carry on meanwhile
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(models.Book.id, models.Book.canonical_id, models.Book.title)
+                .filter(models.Book.id > self._last_id)
+                .order_by(models.Book.id)
+                .all()
+            )
+        except Exception as e:
+            print(f"Error loading book index: {e}")
+            return
+        finally:
+            db.close()
+        with self._lock:
+            for row_id, canonical_id, title in rows:
+                self._titles.setdefault(canonical_id, title)
+                self._last_id = max(self._last_id, row_id)
+
+    def _register(self, canonical_id: str, title: str):
+        from database import SessionLocal
+        import models
+
+        db = SessionLocal()
+        try:
+            db.add(models.Book(canonical_id=canonical_id, title=title))
+            db.commit()
+        except Exception:
+            # Another worker registered it first
+            db.rollback()
+        finally:
+            db.close()
+
+    def _match(self, key: str) -> str | None:
+        if key in self._titles:
+            return key
+        if len(key) < FUZZY_MIN_LENGTH:
+            return None
+        candidates = [k for k in self._titles if abs(len(k) - len(key)) <= 2]
+        for match in difflib.get_close_matches(key, candidates, n=3, cutoff=FUZZY_CUTOFF):
+            if not _is_volume_difference(key, match):
+                return match
+        return None
+
+    def _lookup(self, key: str) -> BookRef | None:
+        with self._lock:
+            match = self._match(key)
+            return BookRef(match, self._titles[match]) if match is not None else None
+
+    def find(self, title: str) -> BookRef | None:
+        """Like `resolve`, but returns None for unknown books instead of registering them."""
+        key = normalize_title(title)
+        ref = self._lookup(key)
+        if ref is None:
+            self._refresh()
+            ref = self._lookup(key)
+        return ref
+
+    def resolve(self, title: str) -> BookRef:
+        key = normalize_title(title)
+        ref = self.find(title)
+        if ref is None:
+            self._register(key, clean_title(title))
+            with self._lock:
+                self._titles.setdefault(key, clean_title(title))
+            ref = self._lookup(key)
+        return ref
+
+book_index = BookIndex()
+
+def resolve_book(title: str) -> BookRef:
+    return book_index.resolve(title)
+
+def find_book(title: str) -> BookRef | None:
+    return book_index.find(title)
@@ -0,0 +1,106 @@
+import re
+
+# Approximate token budget for the search context pasted into LLM prompts.
+CONTEXT_TOKEN_BUDGET = 1200
+
+# Snippets whose character-shingle Jaccard similarity reaches this value are near-duplicates.
+NEAR_DUPLICATE_THRESHOLD = 0.6
+
+# Snippets whose topical score (title and keyword matches only, before the length
+# bonus and position penalty) is below this mention neither the title nor any keyword.
+MIN_RELEVANCE_SCORE = 0.5
+
+SHINGLE_SIZE = 3
+
+RELEVANCE_KEYWORDS = ["作者", "观点", "金句", "内容", "简介", "思想", "名言", "书中", "讲述", "核心"]
+
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local estimate of DeepSeek tokens: CJK characters cost roughly 0.6 token
+    each, everything else roughly a quarter token per character.
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) / 4) + 1
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE_RE.sub("", text).lower()
+
+def _shingles(text: str) -> set[str]:
+    text = _normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def _jaccard(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _topical_score(book_title: str, title: str, body: str) -> float:
+    text = f"{title}{body}"
+    score = 0.0
+    if _normalize(book_title) in _normalize(text):
+        score += 3.0
+    score += 2.0 * len(_shingles(book_title) & _shingles(text)) / max(1, len(_shingles(book_title)))
+    score += 0.5 * sum(1 for keyword in RELEVANCE_KEYWORDS if keyword in text)
+    return score
+
+def _relevance(topical: float, body: str, position: int) -> float:
+    """Ranking score: topical matches plus a length bonus, minus a small position penalty."""
+    # Very short snippets rarely carry usable content
+    score = topical + min(len(body), 200) / 100
+    # Earlier results of earlier queries are usually better matches
+    return score - 0.1 * position
+
+def distill_context(book_title: str, results: list[dict], token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Turns raw search results ({"title", "body"} dicts, possibly merged from several
+    queries) into a compact prompt context: drops near-duplicate snippets, ranks the
+    rest by relevance to the book title and keeps the best ones within `token_budget`.
+    Returns the same "Title:/Summary:" block format the prompts already expect.
+    """
+    candidates = []
+    for position, r in enumerate(results):
+        title = (r.get("title") or "").strip()
+        body = (r.get("body") or "").strip()
+        if not body:
+            continue
+        topical = _topical_score(book_title, title, body)
+        # The floor only looks at topical matches, so neither length nor a late
+        # position (e.g. the 经典语录 query's results) decides what is dropped
+        if topical < MIN_RELEVANCE_SCORE:
+            continue
+        candidates.append({
+            "title": title,
+            "body": body,
+            "shingles": _shingles(body),
+            "score": _relevance(topical, body, position),
+        })
+
+    candidates.sort(key=lambda c: c["score"], reverse=True)
+
+    kept = []
+    for candidate in candidates:
+        if any(_jaccard(candidate["shingles"], k["shingles"]) >= NEAR_DUPLICATE_THRESHOLD for k in kept):
+            continue
+        kept.append(candidate)
+
+    context = ""
+    remaining = token_budget
+    for candidate in kept:
+        block = f"Title: {candidate['title']}\nSummary: {candidate['body']}\n\n"
+        cost = estimate_tokens(block)
+        if cost > remaining:
+            # Trim the last snippet to fit if there's still meaningful room left
+            if remaining >= 100:
+                ratio = remaining / cost
+                body = candidate["body"][:int(len(candidate["body"]) * ratio * 0.9)]
+                context += f"Title: {candidate['title']}\nSummary: {body}…\n\n"
+            break
+        context += block
+        remaining -= cost
+
+    return context
@@ -1,38 +1,235 @@
 import os
+import re
 import subprocess
+import threading
 import time
 
+from services.book_index_service import resolve_book
+from services.mindmap_tree import parse_mindmap_markdown, to_markdown, to_opml, write_xmind
+from services.mindmap_renderer import render_mindmap_files_in_pool, MindMapFontError, JPEG_TARGET_BYTES
+
+# "native" lays out and draws JPG/PDF in Python; "chromium" screenshots the markmap HTML with Puppeteer
+MINDMAP_RENDERER = os.environ.get("MINDMAP_RENDERER", "native")
+
+def _render_with_puppeteer(base_dir: str, static_dir: str, html_temp_path: str, jpg_path: str, pdf_path: str, timestamp: int):
+    """
+    High-fidelity mode: screenshots the markmap HTML with headless Chrome to create the JPG and PDF.
+    """
+    js_script_path = os.path.join(static_dir, f"render_{timestamp}.js")
+    js_content = f"""
+    const puppeteer = require('puppeteer');
+    (async () => {{
+        console.log("STEP 1: Launching Chrome");
+        const browser = await puppeteer.launch({{ args: ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage', '--disable-gpu', '--single-process', '--no-zygote', '--disable-software-rasterizer'] }});
+        console.log("STEP 2: Creating new page");
+        const page = await browser.newPage();
+        
+        console.log("STEP 3: Setting viewport");
+        await page.setViewport({{ width: 1587, height: 1122, deviceScaleFactor: 3 }});
+        
+        console.log("STEP 4: Loading HTML file from file://{html_temp_path}");
+        await page.goto('file://{html_temp_path}', {{ waitUntil: 'networkidle0' }});
+        
+        console.log("STEP 5: Injecting SVG custom styles for JPG");
+        await page.addStyleTag({{ content: `
+            body {{ background: #0f172a !important; margin: 0; padding: 0; }} 
+            svg {{ background: #0f172a !important; }} 
+            svg text, foreignObject div, foreignObject span, foreignObject p {{ 
+                color: #f8fafc !important; 
+                fill: #f8fafc !important; 
+            }} 
+        ` }});
+        
+        console.log("STEP 6: Waiting 2s for anims");
+        await new Promise(r => setTimeout(r, 2000));
+        
+        console.log("STEP 7: Generating screenshot path {jpg_path}");
+        await page.screenshot({{
+            path: '{jpg_path}',
+            type: 'jpeg',
+            quality: 100,
+            fullPage: true
+        }});
+        
+        console.log("STEP 8: Injecting custom styles for PDF");
+        await page.addStyleTag({{ content: `
+            body {{ background: #ffffff !important; }} 
+            svg {{ background: #ffffff !important; }} 
+            svg text, foreignObject div, foreignObject span, foreignObject p {{ 
+                color: #4b5563 !important; 
+                fill: #4b5563 !important; 
+            }} 
+        ` }});
+        
+        console.log("STEP 9: Waiting 500ms");
+        await new Promise(r => setTimeout(r, 500));
+
+        console.log("STEP 10: Printing PDF {pdf_path}");
+        await page.pdf({{
+            path: '{pdf_path}',
+            format: 'A3',
+            landscape: true,
+            printBackground: true,
+            margin: {{ top: '1cm', right: '1cm', bottom: '1cm', left: '1cm' }}
+        }});
+        
+        console.log("STEP 11: Closing browser");
+        await browser.close();
+        console.log("STEP 12: SUCCESS");
+    }})();
+    """
+    
+    with open(js_script_path, "w", encoding="utf-8") as f:
+        f.write(js_content)
+        
+    # Run node script for PDF & JPG
+    result = subprocess.run(
+        ["node", js_script_path],
+        check=False,
+        cwd=base_dir,
+        capture_output=True
+    )
+    
+    stdout_str = result.stdout.decode('utf-8', errors='replace') if result.stdout else ""
+    if result.returncode != 0 and "STEP 12: SUCCESS" not in stdout_str:
+        stderr_str = result.stderr.decode('utf-8', errors='replace') if result.stderr else ""
+        raise Exception(f"Node execution failed: {result.returncode}\nSTDOUT: {stdout_str}\nSTDERR: {stderr_str}")
+    
+    # Cleanup temp JS
+    os.remove(js_script_path)
+
+# JPG/PDF exports are rendered on first download rather than with every mind map
+EXPORT_FORMATS = ("jpg", "pdf")
+_EXPORT_STEM_RE = re.compile(r"^mindmap_[^/\\]+_\d+$")
+# One lock per mind map stem (chromium writes the JPG, PDF and temp HTML together),
+# as [lock, number of requests holding or waiting for it]
+_export_locks: dict[str, list] = {}
+_export_locks_guard = threading.Lock()
+
+def _static_dir() -> str:
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+
+def _render_export_with_chromium(base_dir: str, static_dir: str, md_path: str, stem: str, fmt: str, tmp_path: str):
+    """Renders the markmap HTML with Puppeteer; it produces both formats, so the other one is kept too."""
+    html_temp_path = os.path.join(static_dir, f"{stem}_temp.html")
+    subprocess.run(
+        ["npx", "markmap-cli", md_path, "-o", html_temp_path, "--no-open"],
+        check=True,
+        cwd=base_dir,
+        capture_output=True
+    )
+    jpg_tmp = tmp_path if fmt == "jpg" else os.path.join(static_dir, f"{stem}_render_tmp.jpg")
+    pdf_tmp = tmp_path if fmt == "pdf" else os.path.join(static_dir, f"{stem}_render_tmp.pdf")
+    _render_with_puppeteer(base_dir, static_dir, html_temp_path, jpg_tmp, pdf_tmp, int(time.time() * 1000))
+    os.remove(html_temp_path)
+    # Re-encode Chrome's quality-100 screenshot as a size-capped progressive JPEG
+    from PIL import Image
+    from services.rendition_service import save_jpeg_for_target
+    with Image.open(jpg_tmp) as screenshot:
+        screenshot.load()
+    save_jpeg_for_target(screenshot, jpg_tmp, JPEG_TARGET_BYTES)
+    other_tmp = pdf_tmp if fmt == "jpg" else jpg_tmp
+    other_fmt = "pdf" if fmt == "jpg" else "jpg"
+    os.replace(other_tmp, os.path.join(static_dir, f"{stem}.{other_fmt}"))
+
+def render_mindmap_export(filename: str) -> str:
+    """
+    Returns the local path of a mind map JPG/PDF export such as `mindmap_<title>_<ts>.jpg`,
+    rendering it from the stored Markdown on the first request and serving the stored file afterwards.
+    Raises FileNotFoundError for unknown mind maps and ValueError for unsupported formats.
+    """
+    stem, _, fmt = filename.rpartition(".")
+    if fmt not in EXPORT_FORMATS or not _EXPORT_STEM_RE.match(stem) or os.path.basename(filename) != filename:
+        raise ValueError(f"Unsupported export: {filename}")
+
+    base_dir = os.path.dirname(os.path.dirname(__file__))
+    static_dir = _static_dir()
+    export_path = os.path.join(static_dir, filename)
+    if os.path.exists(export_path):
+        return export_path
+
+    md_path = os.path.join(static_dir, f"{stem}.md")
+    if not os.path.exists(md_path):
+        raise FileNotFoundError(filename)
+
+    with _export_locks_guard:
+        entry = _export_locks.setdefault(stem, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            # Another request may have rendered it while we waited
+            if os.path.exists(export_path):
+                return export_path
+            _render_export(base_dir, static_dir, md_path, stem, fmt, export_path)
+    finally:
+        with _export_locks_guard:
+            # Only drop the lock once nobody is waiting on it
+            entry[1] -= 1
+            if not entry[1]:
+                _export_locks.pop(stem, None)
+
+    return export_path
+
+def _render_export(base_dir: str, static_dir: str, md_path: str, stem: str, fmt: str, export_path: str):
+    with open(md_path, "r", encoding="utf-8") as f:
+        markdown_content = f.read()
+
+    # Render to a temp name and rename, so a half-written file is never served
+    tmp_path = os.path.join(static_dir, f"{stem}_render_tmp.{fmt}")
+    try:
+        if MINDMAP_RENDERER == "chromium":
+            _render_export_with_chromium(base_dir, static_dir, md_path, stem, fmt, tmp_path)
+        elif fmt == "jpg":
+            try:
+                render_mindmap_files_in_pool(markdown_content, "思维导图", jpg_path=tmp_path)
+            except MindMapFontError as e:
+                print(f"Native mind map JPG unavailable ({e}), falling back to chromium")
+                _render_export_with_chromium(base_dir, static_dir, md_path, stem, fmt, tmp_path)
+        else:
+            render_mindmap_files_in_pool(markdown_content, "思维导图", pdf_path=tmp_path)
+        os.replace(tmp_path, export_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 def generate_mindmap_document(book_title: str, markdown_content: str) -> str:
     """
     Saves the markdown to a file, uses markmap-cli to generate an interactive HTML,
     injects a floating export toolbar (PDF, XMind, MindManager) into the HTML,
-    executes Puppeteer to create a bold, highly readable PDF, and saves all files.
+    and saves all files. The JPG and the bold, highly readable PDF are rendered lazily
+    by `render_mindmap_export` when first downloaded.
+    Native XMind (.xmind) and OPML (for MindManager) files are written directly from the parsed tree.
     Returns the local path/URL to the interactive HTML.
     """
     base_dir = os.path.dirname(os.path.dirname(__file__))
-    static_dir = os.path.join(base_dir, "static")
+    static_dir = _static_dir()
     os.makedirs(static_dir, exist_ok=True)
     
     timestamp = int(time.time())
-    safe_title = book_title.replace(" ", "_").replace("/", "_")
+    # Same canonical id as the analysis cache; it contains only letters and digits, so it's filename-safe
+    safe_title = resolve_book(book_title).canonical_id
     
     md_filename = f"mindmap_{safe_title}_{timestamp}.md"
     html_filename = f"mindmap_{safe_title}_{timestamp}.html"
     html_temp_filename = f"mindmap_{safe_title}_{timestamp}_temp.html"
     pdf_filename = f"mindmap_{safe_title}_{timestamp}.pdf"
     jpg_filename = f"mindmap_{safe_title}_{timestamp}.jpg"
+    xmind_filename = f"mindmap_{safe_title}_{timestamp}.xmind"
+    opml_filename = f"mindmap_{safe_title}_{timestamp}.opml"
     
     md_path = os.path.join(static_dir, md_filename)
     html_path = os.path.join(static_dir, html_filename)
     html_temp_path = os.path.join(static_dir, html_temp_filename)
-    pdf_path = os.path.join(static_dir, pdf_filename)
-    jpg_path = os.path.join(static_dir, jpg_filename)
     
-    # 1. Save Markdown
-    with open(md_path, "w", encoding="utf-8") as f:
-        f.write(markdown_content)
-        
     try:
+        # 1. Parse & validate the tree, then save normalized Markdown and native exports
+        tree = parse_mindmap_markdown(markdown_content, root_title=f"《{book_title}》")
+        with open(md_path, "w", encoding="utf-8") as f:
+            f.write(to_markdown(tree))
+        write_xmind(tree, os.path.join(static_dir, xmind_filename))
+        with open(os.path.join(static_dir, opml_filename), "w", encoding="utf-8") as f:
+            f.write(to_opml(tree))
+
         # 2. Convert MD to HTML using markmap to a TEMP file
         subprocess.run(
             ["npx", "markmap-cli", md_path, "-o", html_temp_path],
@@ -41,102 +238,18 @@ def generate_mindmap_document(book_title: str, markdown_content: str) -> str:
             capture_output=True
         )
         
-        # 3. Create a quick Puppeteer script to convert HTML to PDF & JPG
-        js_script_path = os.path.join(static_dir, f"render_{timestamp}.js")
-        js_content = f"""
-        const puppeteer = require('puppeteer');
-        (async () => {{
-            console.log("STEP 1: Launching Chrome");
-            const browser = await puppeteer.launch({{ args: ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage', '--disable-gpu', '--single-process', '--no-zygote', '--disable-software-rasterizer'] }});
-            console.log("STEP 2: Creating new page");
-            const page = await browser.newPage();
-            
-            console.log("STEP 3: Setting viewport");
-            await page.setViewport({{ width: 1587, height: 1122, deviceScaleFactor: 3 }});
-            
-            console.log("STEP 4: Loading HTML file from file://{html_temp_path}");
-            await page.goto('file://{html_temp_path}', {{ waitUntil: 'networkidle0' }});
-            
-            console.log("STEP 5: Injecting SVG custom styles for JPG");
-            await page.addStyleTag({{ content: `
-                body {{ background: #0f172a !important; margin: 0; padding: 0; }} 
-                svg {{ background: #0f172a !important; }} 
-                svg text, foreignObject div, foreignObject span, foreignObject p {{ 
-                    color: #f8fafc !important; 
-                    fill: #f8fafc !important; 
-                }} 
-            ` }});
-            
-            console.log("STEP 6: Waiting 2s for anims");
-            await new Promise(r => setTimeout(r, 2000));
-            
-            console.log("STEP 7: Generating screenshot path {jpg_path}");
-            await page.screenshot({{
-                path: '{jpg_path}',
-                type: 'jpeg',
-                quality: 100,
-                fullPage: true
-            }});
-            
-            console.log("STEP 8: Injecting custom styles for PDF");
-            await page.addStyleTag({{ content: `
-                body {{ background: #ffffff !important; }} 
-                svg {{ background: #ffffff !important; }} 
-                svg text, foreignObject div, foreignObject span, foreignObject p {{ 
-                    color: #4b5563 !important; 
-                    fill: #4b5563 !important; 
-                }} 
-            ` }});
-            
-            console.log("STEP 9: Waiting 500ms");
-            await new Promise(r => setTimeout(r, 500));
-
-            console.log("STEP 10: Printing PDF {pdf_path}");
-            await page.pdf({{
-                path: '{pdf_path}',
-                format: 'A3',
-                landscape: true,
-                printBackground: true,
-                margin: {{ top: '1cm', right: '1cm', bottom: '1cm', left: '1cm' }}
-            }});
-            
-            console.log("STEP 11: Closing browser");
-            await browser.close();
-            console.log("STEP 12: SUCCESS");
-        }})();
-        """
-        
-        with open(js_script_path, "w", encoding="utf-8") as f:
-            f.write(js_content)
-            
-        # Run node script for PDF & JPG
-        result = subprocess.run(
-            ["node", js_script_path],
-            check=False,
-            cwd=base_dir,
-            capture_output=True
-        )
-        
-        stdout_str = result.stdout.decode('utf-8', errors='replace') if result.stdout else ""
-        if result.returncode != 0 and "STEP 12: SUCCESS" not in stdout_str:
-            stderr_str = result.stderr.decode('utf-8', errors='replace') if result.stderr else ""
-            raise Exception(f"Node execution failed: {result.returncode}\nSTDOUT: {stdout_str}\nSTDERR: {stderr_str}")
-        
-        # Cleanup temp JS
-        os.remove(js_script_path)
-        
-        # 4. Inject Export Toolbar into the HTML for the browser
+        # 3. Inject Export Toolbar into the HTML for the browser
         with open(html_temp_path, "r", encoding="utf-8") as f:
             html_content = f.read()
             
         toolbar_html = f"""
 <div style="position: fixed; top: 20px; right: 20px; z-index: 9999; background: rgba(255,255,255,0.95); padding: 15px; border-radius: 12px; box-shadow: 0 10px 25px rgba(0,0,0,0.15); font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif; backdrop-filter: blur(10px); border: 1px solid rgba(0,0,0,0.05); min-width: 220px;">
     <h3 style="margin: 0 0 15px 0; font-size: 16px; color: #1e293b; text-align: center; border-bottom: 2px solid #f1f5f9; padding-bottom: 10px;">💾 导出思维导图</h3>
-    <a href="./{jpg_filename}" download style="display: block; margin-bottom: 10px; text-decoration: none; color: white; background: #eab308; padding: 10px 15px; border-radius: 8px; text-align: center; font-size: 14px; font-weight: 600; transition: background 0.2s; box-shadow: 0 2px 4px rgba(234, 179, 8, 0.3);">🖼️ 下载高清长图 (JPG)</a>
-    <a href="./{pdf_filename}" download style="display: block; margin-bottom: 10px; text-decoration: none; color: white; background: #3b82f6; padding: 10px 15px; border-radius: 8px; text-align: center; font-size: 14px; font-weight: 600; transition: background 0.2s; box-shadow: 0 2px 4px rgba(59, 130, 246, 0.3);">📄 下载打印版 (PDF)</a>
-    <a href="./{md_filename}" download="mindmap_xmind.md" style="display: block; margin-bottom: 10px; text-decoration: none; color: white; background: #10b981; padding: 10px 15px; border-radius: 8px; text-align: center; font-size: 14px; font-weight: 600; transition: background 0.2s; box-shadow: 0 2px 4px rgba(16, 185, 129, 0.3);">📊 导出 XMind 格式</a>
-    <a href="./{md_filename}" download="mindmap_mindmanager.md" style="display: block; text-decoration: none; color: white; background: #f59e0b; padding: 10px 15px; border-radius: 8px; text-align: center; font-size: 14px; font-weight: 600; transition: background 0.2s; box-shadow: 0 2px 4px rgba(245, 158, 11, 0.3);">🧠 导出 MindManager</a>
-    <p style="margin: 15px 0 0 0; font-size: 12px; color: #64748b; text-align: center; line-height: 1.4;">提示：XMind 和 MindManager<br>均原生支持直接导入 Markdown</p>
+    <a href="../api/mindmap_export/{jpg_filename}" download style="display: block; margin-bottom: 10px; text-decoration: none; color: white; background: #eab308; padding: 10px 15px; border-radius: 8px; text-align: center; font-size: 14px; font-weight: 600; transition: background 0.2s; box-shadow: 0 2px 4px rgba(234, 179, 8, 0.3);">🖼️ 下载高清长图 (JPG)</a>
+    <a href="../api/mindmap_export/{pdf_filename}" download style="display: block; margin-bottom: 10px; text-decoration: none; color: white; background: #3b82f6; padding: 10px 15px; border-radius: 8px; text-align: center; font-size: 14px; font-weight: 600; transition: background 0.2s; box-shadow: 0 2px 4px rgba(59, 130, 246, 0.3);">📄 下载打印版 (PDF)</a>
+    <a href="./{xmind_filename}" download style="display: block; margin-bottom: 10px; text-decoration: none; color: white; background: #10b981; padding: 10px 15px; border-radius: 8px; text-align: center; font-size: 14px; font-weight: 600; transition: background 0.2s; box-shadow: 0 2px 4px rgba(16, 185, 129, 0.3);">📊 导出 XMind 格式</a>
+    <a href="./{opml_filename}" download style="display: block; text-decoration: none; color: white; background: #f59e0b; padding: 10px 15px; border-radius: 8px; text-align: center; font-size: 14px; font-weight: 600; transition: background 0.2s; box-shadow: 0 2px 4px rgba(245, 158, 11, 0.3);">🧠 导出 MindManager</a>
+    <p style="margin: 15px 0 0 0; font-size: 12px; color: #64748b; text-align: center; line-height: 1.4;">提示：XMind 直接打开 .xmind 文件<br>MindManager 通过 文件→导入 打开 .opml<br><a href="./{md_filename}" download style="color: #64748b;">下载 Markdown 源文件</a></p>
 </div>
         """
         html_content = html_content.replace('</body>', toolbar_html + '</body>')
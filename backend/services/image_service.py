@@ -1,9 +1,16 @@
 import os
-from zhipuai import ZhipuAI
 
 # Zhipu AI GLM API Key
 # Ensure ZHIPU_API_KEY is in your .env
-zhipu_client = ZhipuAI(api_key=os.environ.get("ZHIPU_API_KEY", ""))
+_zhipu_client = None
+
+def get_zhipu_client():
+    """Imports the Zhipu SDK and builds the client on first use to keep startup fast."""
+    global _zhipu_client
+    if _zhipu_client is None:
+        from zhipuai import ZhipuAI
+        _zhipu_client = ZhipuAI(api_key=os.environ.get("ZHIPU_API_KEY", ""))
+    return _zhipu_client
 
 def generate_image(core_thought: str) -> str:
     """
@@ -11,7 +18,7 @@ def generate_image(core_thought: str) -> str:
     Returns the URL string of the generated image.
     """
     try:
-        response = zhipu_client.images.generations(
+        response = get_zhipu_client().images.generations(
             model="cogview-3", # Use GLM image model CogView-3
             prompt=core_thought,
             size="1024x1024"
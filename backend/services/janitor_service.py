@@ -0,0 +1,164 @@
+"""
+Keeps backend/static bounded: per-type TTLs, orphaned temp files from crashed
+renders, and an overall disk quota enforced oldest-first.
+
+Report what would be reclaimed, or clean up now:
+    python -m services.janitor_service --dry-run
+    python -m services.janitor_service
+"""
+import argparse
+import asyncio
+import os
+import re
+import time
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+STATIC_QUOTA_BYTES = int(os.environ.get("STATIC_QUOTA_MB", "2048")) * 1024 * 1024
+# Enforce the quota down to this fraction so we don't evict on every pass
+QUOTA_TARGET_RATIO = 0.9
+JANITOR_INTERVAL_SECONDS = int(os.environ.get("JANITOR_INTERVAL_SECONDS", "600"))
+SCAN_BATCH_SIZE = 500
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# category -> (filename pattern, TTL in seconds, quota eviction tier: lower goes first)
+CATEGORIES = {
+    # Leftovers from crashed or in-flight renders; the TTL leaves running renders alone
+    "orphan": (re.compile(r"^(render_\d+\.js|.*_temp\.html|.*_render_tmp\.\w+)$"), HOUR, 0),
+    "fallback": (re.compile(r"^mindmap_.*_fallback\.txt$"), DAY, 0),
+    # Lazily rendered JPG/PDF, regenerated from the Markdown on the next download
+    "mindmap_export": (re.compile(r"^mindmap_.*\.(jpg|pdf)$"), 7 * DAY, 1),
+    # Removed together per map: the HTML's JPG/PDF links need the .md to render
+    "mindmap": (re.compile(r"^mindmap_.*\.(md|html|xmind|opml)$"), 30 * DAY, 2),
+    "poster": (re.compile(r"^poster_.*\.(jpg|webp|avif)$"), 30 * DAY, 2),
+}
+
+def classify(filename: str) -> str | None:
+    for category, (pattern, _, _) in CATEGORIES.items():
+        if pattern.match(filename):
+            return category
+    return None
+
+def _scan(static_dir: str):
+    """Yields batches of (name, path, category, size, mtime) using scandir, pausing between batches."""
+    batch = []
+    with os.scandir(static_dir) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            category = classify(entry.name)
+            if category is None:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            batch.append((entry.name, entry.path, category, stat.st_size, stat.st_mtime))
+            if len(batch) >= SCAN_BATCH_SIZE:
+                yield batch
+                batch = []
+                # Give other threads (and the disk) room between batches
+                time.sleep(0.01)
+    if batch:
+        yield batch
+
+# Categories whose files are kept or evicted as one unit per stem
+GROUPED_CATEGORIES = {"mindmap"}
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        # Another worker's janitor got there first
+        return False
+    except OSError as e:
+        print(f"Janitor could not remove {path}: {e}")
+        return False
+
+def run_janitor(static_dir: str = STATIC_DIR, quota_bytes: int = STATIC_QUOTA_BYTES, dry_run: bool = False, now: float | None = None) -> dict:
+    """
+    One cleanup pass: removes files past their category TTL, then the oldest files
+    (lowest tier first) until the directory is back under the quota. A mind map's
+    md/html/xmind/opml are aged by the newest of them and removed together.
+    Returns a report of file counts/bytes per category and what was (or would be) reclaimed.
+    """
+    now = now or time.time()
+    report = {
+        "dry_run": dry_run,
+        "categories": {name: {"files": 0, "bytes": 0} for name in CATEGORIES},
+        "expired": {"files": 0, "bytes": 0},
+        "over_quota": {"files": 0, "bytes": 0},
+        "total_bytes": 0,
+    }
+    if not os.path.isdir(static_dir):
+        return report
+
+    # (category, key) -> [newest mtime, [(path, size), ...]]; ungrouped files are their own unit
+    units = {}
+    for batch in _scan(static_dir):
+        for name, path, category, size, mtime in batch:
+            report["categories"][category]["files"] += 1
+            report["categories"][category]["bytes"] += size
+            key = name.rpartition(".")[0] if category in GROUPED_CATEGORIES else name
+            unit = units.setdefault((category, key), [mtime, []])
+            unit[0] = max(unit[0], mtime)
+            unit[1].append((path, size))
+
+    def remove_unit(files: list, bucket: str) -> int:
+        removed = 0
+        for path, size in files:
+            if dry_run or _remove(path):
+                report[bucket]["files"] += 1
+                report[bucket]["bytes"] += size
+                removed += size
+        return removed
+
+    survivors = []
+    total = 0
+    for (category, _), (mtime, files) in units.items():
+        if now - mtime > CATEGORIES[category][1]:
+            remove_unit(files, "expired")
+            continue
+        size = sum(s for _, s in files)
+        survivors.append((CATEGORIES[category][2], mtime, size, files))
+        total += size
+
+    if total > quota_bytes:
+        target = quota_bytes * QUOTA_TARGET_RATIO
+        for _, _, size, files in sorted(survivors, key=lambda unit: unit[:2]):
+            if total <= target:
+                break
+            # A partially failed removal still frees what it freed
+            total -= remove_unit(files, "over_quota")
+
+    report["total_bytes"] = total
+    return report
+
+async def janitor_loop(interval: int = JANITOR_INTERVAL_SECONDS):
+    """Background task: runs a cleanup pass in a worker thread every `interval` seconds."""
+    while True:
+        try:
+            report = await asyncio.to_thread(run_janitor)
+            reclaimed = report["expired"]["bytes"] + report["over_quota"]["bytes"]
+            if reclaimed:
+                print(f"Janitor reclaimed {reclaimed / 1024 / 1024:.1f} MB "
+                      f"({report['expired']['files']} expired, {report['over_quota']['files']} over quota)")
+        except Exception as e:
+            print(f"Janitor pass failed: {e}")
+        await asyncio.sleep(interval)
+
+def _print_report(report: dict):
+    mb = lambda b: f"{b / 1024 / 1024:.1f} MB"
+    verb = "Reclaimable" if report["dry_run"] else "Reclaimed"
+    print(f"Static directory: {STATIC_DIR}")
+    for name, usage in report["categories"].items():
+        print(f"  {name:<15} {usage['files']:>6} files  {mb(usage['bytes']):>10}")
+    print(f"{verb} by TTL:   {report['expired']['files']} files, {mb(report['expired']['bytes'])}")
+    print(f"{verb} by quota: {report['over_quota']['files']} files, {mb(report['over_quota']['bytes'])} "
+          f"(quota {mb(STATIC_QUOTA_BYTES)})")
+    print(f"Remaining: {mb(report['total_bytes'])}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean up expired and over-quota files in backend/static.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report reclaimable space")
+    args = parser.parse_args()
+    _print_report(run_janitor(dry_run=args.dry_run))
@@ -0,0 +1,189 @@
+"""
+Persistent, size-bounded LRU cache of LLM responses shared by all worker processes.
+
+Entries are keyed by a hash of (model, messages, temperature, max_tokens) and stored
+zlib-compressed in a local SQLite file (WAL mode, so concurrent workers are safe).
+
+Entries are tagged with the canonical ids of the books their prompts were built
+for. Invalidate everything cached for a book (any title variant), including the
+analyses running workers hold in memory, from the command line:
+    python -m services.llm_cache invalidate "人类简史"
+    python -m services.llm_cache stats
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from services.book_index_service import resolve_book, find_book, normalize_title
+
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "llm_cache.db"))
+MAX_CACHE_BYTES = int(os.environ.get("LLM_CACHE_MAX_MB", "200")) * 1024 * 1024
+# Evict down to this fraction of the limit so we don't evict on every insert
+EVICT_TARGET_RATIO = 0.9
+
+_local = threading.local()
+
+def _connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_PATH, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                latency REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access);
+            CREATE TABLE IF NOT EXISTS entry_books (
+                key TEXT NOT NULL,
+                book_title TEXT NOT NULL,
+                PRIMARY KEY (key, book_title)
+            );
+            CREATE INDEX IF NOT EXISTS ix_entry_books_title ON entry_books (book_title);
+            CREATE TABLE IF NOT EXISTS invalidations (
+                book_title TEXT PRIMARY KEY,
+                invalidated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stats (
+                kind TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0,
+                saved_seconds REAL NOT NULL DEFAULT 0
+            );
+        """)
+        _local.conn = conn
+    return conn
+
+def make_key(model: str, messages: list[dict], temperature: float, max_tokens: int, **extra) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens, **extra},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _record(kind: str, hit: bool, saved_seconds: float = 0.0):
+    _connection().execute(
+        "INSERT INTO stats (kind, hits, misses, saved_seconds) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(kind) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses, "
+        "saved_seconds = saved_seconds + excluded.saved_seconds",
+        (kind, int(hit), int(not hit), saved_seconds),
+    )
+
+def get(key: str, kind: str) -> dict | None:
+    """Returns the cached {"content", "tokens"} for `key`, counting a hit or miss for `kind`."""
+    try:
+        conn = _connection()
+        row = conn.execute("SELECT value, latency FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            _record(kind, hit=False)
+            return None
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        _record(kind, hit=True, saved_seconds=row[1])
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+    except Exception as e:
+        print(f"LLM cache read error: {e}")
+        return None
+
+def put(key: str, value: dict, latency: float, book_titles: list[str]):
+    try:
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        canonical_ids = {resolve_book(title).canonical_id for title in book_titles}
+        now = time.time()
+        conn = _connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, latency, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, blob, len(blob), latency, now, now),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO entry_books (key, book_title) VALUES (?, ?)",
+                [(key, canonical_id) for canonical_id in canonical_ids],
+            )
+            _evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except Exception as e:
+        print(f"LLM cache write error: {e}")
+
+def _evict(conn: sqlite3.Connection):
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= MAX_CACHE_BYTES:
+        return
+    target = MAX_CACHE_BYTES * EVICT_TARGET_RATIO
+    evicted = []
+    for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC"):
+        if total <= target:
+            break
+        evicted.append((key,))
+        total -= size
+    conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+    conn.executemany("DELETE FROM entry_books WHERE key = ?", evicted)
+
+def invalidate_book(book_title: str) -> int:
+    """
+    Drops every cached response whose prompt was built for `book_title` and records
+    the invalidation, so running workers also discard their in-memory analysis of
+    the book (see `invalidated_at`). Returns the number of responses removed.
+    """
+    ref = find_book(book_title)
+    canonical_id = ref.canonical_id if ref else normalize_title(book_title)
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        keys = [(row[0],) for row in conn.execute("SELECT key FROM entry_books WHERE book_title = ?", (canonical_id,))]
+        conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+        conn.executemany("DELETE FROM entry_books WHERE key = ?", keys)
+        conn.execute(
+            "INSERT OR REPLACE INTO invalidations (book_title, invalidated_at) VALUES (?, ?)",
+            (canonical_id, time.time()),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(keys)
+
+def invalidated_at(canonical_id: str) -> float:
+    """Wall-clock time of the last invalidation of the book, or 0.0 if it was never invalidated."""
+    try:
+        row = _connection().execute(
+            "SELECT invalidated_at FROM invalidations WHERE book_title = ?", (canonical_id,)
+        ).fetchone()
+        return row[0] if row else 0.0
+    except Exception as e:
+        print(f"LLM cache read error: {e}")
+        return 0.0
+
+def stats() -> dict:
+    conn = _connection()
+    entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+    per_call = {}
+    for kind, hits, misses, saved in conn.execute("SELECT kind, hits, misses, saved_seconds FROM stats ORDER BY kind"):
+        per_call[kind] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "saved_seconds": round(saved, 1),
+        }
+    return {"entries": entries, "size_bytes": size, "max_bytes": MAX_CACHE_BYTES, "calls": per_call}
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "invalidate":
+        print(f"Removed {invalidate_book(sys.argv[2])} cached responses for 《{sys.argv[2]}》")
+    elif len(sys.argv) == 2 and sys.argv[1] == "stats":
+        print(json.dumps(stats(), ensure_ascii=False, indent=2))
+    else:
+        print(__doc__)
@@ -0,0 +1,185 @@
+import os
+import json
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# OpenAI-compatible chat backends, tried in order of their recent latency.
+# Override with LLM_PROVIDERS in .env, a JSON list such as:
+# [{"name": "deepseek", "base_url": "https://api.deepseek.com", "api_key_env": "DEEPSEEK_API_KEY", "model": "deepseek-chat"},
+#  {"name": "siliconflow", "base_url": "https://api.siliconflow.cn/v1", "api_key_env": "SILICONFLOW_API_KEY", "model": "deepseek-ai/DeepSeek-V3"}]
+DEFAULT_PROVIDERS = [
+    {"name": "deepseek", "base_url": "https://api.deepseek.com", "api_key_env": "DEEPSEEK_API_KEY", "model": "deepseek-chat"},
+]
+
+# Hedged requests may add at most this fraction of extra LLM load
+HEDGE_BUDGET_RATIO = float(os.environ.get("LLM_HEDGE_BUDGET", "0.05"))
+# Hedge delay is the primary's p95 latency, clamped to this range (seconds)
+HEDGE_MIN_DELAY = 2.0
+HEDGE_MAX_DELAY = 30.0
+# Used until a provider has enough latency samples for a meaningful p95
+HEDGE_DEFAULT_DELAY = 15.0
+MIN_SAMPLES_FOR_P95 = 20
+LATENCY_WINDOW = 200
+EWMA_ALPHA = 0.2
+# Latency charged to a provider's EWMA when a request fails
+ERROR_PENALTY_SECONDS = 60.0
+REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", "120"))
+# The OpenAI SDK's own retries (with backoff on 429/5xx). Only used when there's no
+# other provider to fail over to; with several providers failover is faster.
+SDK_MAX_RETRIES = 2
+
+class LLMProvider:
+    def __init__(self, name: str, base_url: str, api_key: str, model: str | None = None, max_retries: int = 0):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self._api_key = api_key
+        self._client = None
+        self.ewma_latency: float | None = None
+        # Latency samples per max_tokens, since a 200-token answer and a
+        # 4000-token mind map have very different distributions
+        self._samples: dict[int, deque] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # The OpenAI SDK is slow to import, so it's only loaded by the first request
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self._api_key, base_url=self.base_url, timeout=REQUEST_TIMEOUT, max_retries=self.max_retries)
+        return self._client
+
+    def record(self, latency: float, max_tokens: int, success: bool = True):
+        with self._lock:
+            observed = latency if success else max(latency, ERROR_PENALTY_SECONDS)
+            if self.ewma_latency is None:
+                self.ewma_latency = observed
+            else:
+                self.ewma_latency = EWMA_ALPHA * observed + (1 - EWMA_ALPHA) * self.ewma_latency
+            if success:
+                self._samples.setdefault(max_tokens, deque(maxlen=LATENCY_WINDOW)).append(latency)
+
+    def p95(self, max_tokens: int) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get(max_tokens, ()))
+        if len(samples) < MIN_SAMPLES_FOR_P95:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)]
+
+    def routing_score(self) -> float:
+        # Untried providers score 0 so they get sampled
+        return self.ewma_latency or 0.0
+
+    def create(self, model: str, **kwargs):
+        start = time.monotonic()
+        try:
+            response = self.client.chat.completions.create(model=self.model or model, **kwargs)
+        except Exception:
+            self.record(time.monotonic() - start, kwargs.get("max_tokens", 0), success=False)
+            raise
+        self.record(time.monotonic() - start, kwargs.get("max_tokens", 0))
+        return response
+
+class LLMProviderPool:
+    """
+    Routes chat completions to the provider with the lowest latency EWMA, fails over
+    to the next provider on errors, and sends one hedged duplicate request when the
+    primary hasn't answered within its p95 latency. The first successful answer wins.
+    """
+
+    def __init__(self, providers: list[LLMProvider], hedge_budget_ratio: float = HEDGE_BUDGET_RATIO):
+        self.providers = providers
+        self.hedge_budget_ratio = hedge_budget_ratio
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hedges = 0
+
+    def _hedge_delay(self, provider: LLMProvider, max_tokens: int) -> float:
+        p95 = provider.p95(max_tokens)
+        if p95 is None:
+            return HEDGE_DEFAULT_DELAY
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, p95))
+
+    def _take_hedge_budget(self) -> bool:
+        with self._lock:
+            if self._hedges + 1 > self.hedge_budget_ratio * self._requests:
+                return False
+            self._hedges += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "hedges": self._hedges,
+                "providers": {p.name: p.ewma_latency for p in self.providers},
+            }
+
+    def chat_completion(self, model: str, **kwargs):
+        with self._lock:
+            self._requests += 1
+            # Decay the counters so the budget tracks recent load
+            if self._requests > 10000:
+                self._requests //= 2
+                self._hedges //= 2
+
+        ranked = sorted(self.providers, key=lambda p: p.routing_score())
+        remaining = list(ranked)
+        primary = remaining.pop(0)
+        futures = {self._executor.submit(primary.create, model, **kwargs)}
+
+        done, _ = wait(futures, timeout=self._hedge_delay(primary, kwargs.get("max_tokens", 0)))
+        if not done and self._take_hedge_budget():
+            # With a single provider the hedge goes to the same backend over a new connection
+            backup = remaining.pop(0) if remaining else primary
+            print(f"LLM hedge: {primary.name} slow, sending duplicate to {backup.name}")
+            futures.add(self._executor.submit(backup.create, model, **kwargs))
+
+        last_error = None
+        pending = futures
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # Drop the loser; a request already in flight finishes in the
+                    # background (bounded by REQUEST_TIMEOUT) and its result is discarded
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+                last_error = future.exception()
+                print(f"LLM provider error: {last_error}")
+            if not pending and remaining:
+                failover = remaining.pop(0)
+                pending = {self._executor.submit(failover.create, model, **kwargs)}
+
+        raise last_error
+
+def _load_provider_configs() -> list[dict]:
+    raw = os.environ.get("LLM_PROVIDERS")
+    if raw:
+        try:
+            return json.loads(raw)
+        except Exception as e:
+            print(f"Invalid LLM_PROVIDERS, using DeepSeek only: {e}")
+    return DEFAULT_PROVIDERS
+
+def build_provider_pool() -> LLMProviderPool:
+    configs = _load_provider_configs()
+    providers = [
+        LLMProvider(
+            name=cfg.get("name", cfg["base_url"]),
+            base_url=cfg["base_url"],
+            api_key=os.environ.get(cfg.get("api_key_env", ""), cfg.get("api_key", "")),
+            model=cfg.get("model"),
+            max_retries=SDK_MAX_RETRIES if len(configs) == 1 else 0,
+        )
+        for cfg in configs
+    ]
+    return LLMProviderPool(providers)
@@ -1,19 +1,96 @@
-import os
-from openai import OpenAI
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# DeepSeek is compatible with the OpenAI SDK
+from services import llm_cache
+from services.llm_providers import build_provider_pool, LLMProviderPool
+from services.mindmap_tree import parse_mindmap_markdown, MindMapValidationError
+
+# DeepSeek (and any other backend in LLM_PROVIDERS) is compatible with the OpenAI SDK
 # Ensure DEEPSEEK_API_KEY is in your .env
-client = OpenAI(
-    api_key=os.environ.get("DEEPSEEK_API_KEY", ""),
-    base_url="https://api.deepseek.com"
-)
+_llm_pool = None
+_llm_pool_lock = threading.Lock()
+
+FALLBACK_CORE_THOUGHT = "一本书静静地躺在阳光明媚的书桌上，散发着知识的光芒。"
+
+def get_llm_pool() -> LLMProviderPool:
+    """Builds the provider pool on first use rather than at import time."""
+    global _llm_pool
+    if _llm_pool is None:
+        with _llm_pool_lock:
+            if _llm_pool is None:
+                _llm_pool = build_provider_pool()
+    return _llm_pool
+
+def _chat(kind: str, book_titles: list[str], messages: list[dict], temperature: float, max_tokens: int, validate=None, **extra) -> tuple[str, int]:
+    """
+    Sends a chat completion through the provider pool, serving repeated prompts from
+    the persistent LLM cache. Only responses accepted by `validate` are cached.
+    Returns (content, total_tokens); tokens are 0 on a cache hit.
+    """
+    model = "deepseek-chat"
+    key = llm_cache.make_key(model, messages, temperature, max_tokens, **extra)
+    cached = llm_cache.get(key, kind)
+    if cached is not None:
+        return cached["content"], 0
+
+    start = time.monotonic()
+    response = get_llm_pool().chat_completion(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        **extra
+    )
+    content = response.choices[0].message.content.strip()
+    tokens = response.usage.total_tokens if response.usage else 0
+    if validate is None or validate(content):
+        llm_cache.put(key, {"content": content, "tokens": tokens}, time.monotonic() - start, book_titles)
+    return content, tokens
+
+def _parses_as_json_object(content: str) -> bool:
+    try:
+        return isinstance(json.loads(_strip_json_fence(content)), dict)
+    except ValueError:
+        return False
+
+def _strip_json_fence(content: str) -> str:
+    """
+    Strip potential markdown formatting if the model still outputs it.
+    """
+    if content.startswith("```json"):
+        content = content[7:]
+    elif content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    return content.strip()
+
+def _strip_markdown_fence(content: str) -> str:
+    if content.startswith("```markdown"):
+        content = content[11:]
+    elif content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    return content.strip()
 
 def extract_quotes(book_title: str, context: str) -> list[str]:
     """
     Uses DeepSeek to extract 10 quotes based on the search context.
     Returns a list of strings.
     """
+    try:
+        return _extract_quotes(book_title, context)
+    except Exception as e:
+        print(f"Error during LLM extraction: {e}")
+        return _fallback_quotes(book_title)
+
+def _fallback_quotes(book_title: str) -> list[str]:
+    return [f"关于《{book_title}》的精彩分享（默认金句 {i+1}）" for i in range(10)]
+
+def _extract_quotes(book_title: str, context: str) -> list[str]:
     
     prompt = f"""
     我需要你根据以下关于《{book_title}》的搜索内容，提取并生成以下信息。
@@ -30,37 +107,41 @@ def extract_quotes(book_title: str, context: str) -> list[str]:
     }}
     """
     
+    content, _ = _chat(
+        "extract_quotes",
+        [book_title],
+        messages=[
+            {"role": "system", "content": "你是一个专业的图书拆解专家和文案大师。"},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=1500,
+        validate=lambda c: _valid_quotes(_parse_quotes(c))
+    )
+
+    quotes = _parse_quotes(content)
+    if not _valid_quotes(quotes):
+        raise ValueError("LLM response has no valid quotes")
+    return quotes
+
+def _parse_quotes(content: str):
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "你是一个专业的图书拆解专家和文案大师。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1500
-        )
-        
-        content = response.choices[0].message.content.strip()
-        
-        # Strip potential markdown formatting if the model still outputs it
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
-            
-        result = json.loads(content.strip())
-        return result.get("quotes", [])
-        
-    except Exception as e:
-        print(f"Error during LLM extraction: {e}")
-        # Fallback response
-        return [f"关于《{book_title}》的精彩分享（默认金句 {i+1}）" for i in range(10)]
+        result = json.loads(_strip_json_fence(content))
+    except ValueError:
+        return None
+    return result.get("quotes") if isinstance(result, dict) else None
 
 def generate_core_thought(book_title: str, context: str) -> str:
     """
     Generate a visualizable core thought based on the book's overall meaning.
     """
+    try:
+        return _generate_core_thought(book_title, context)
+    except Exception as e:
+        print(f"Error generating core thought: {e}")
+        return FALLBACK_CORE_THOUGHT
+
+def _generate_core_thought(book_title: str, context: str) -> str:
     prompt = f"""
     书籍《{book_title}》的背景与核心观点如下：
     {context}
@@ -69,25 +150,35 @@ def generate_core_thought(book_title: str, context: str) -> str:
     直接返回这段文字，不需要任何解释。
     """
 
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "你是一个专业的AI生图提示词设计师。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=200
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error generating core thought: {e}")
-        return "一本书静静地躺在阳光明媚的书桌上，散发着知识的光芒。"
+    content, _ = _chat(
+        "core_thought",
+        [book_title],
+        messages=[
+            {"role": "system", "content": "你是一个专业的AI生图提示词设计师。"},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=200,
+        validate=bool
+    )
+    if not content:
+        raise ValueError("LLM returned an empty core thought")
+    return content
 
 def generate_mindmap_markdown(book_title: str, context: str) -> str:
     """
     Generate a structured Markdown mind map representation of the book.
     """
+    try:
+        return _generate_mindmap_markdown(book_title, context)
+    except Exception as e:
+        print(f"Error generating mindmap: {e}")
+        return _fallback_mindmap(book_title, e)
+
+def _fallback_mindmap(book_title: str, error: Exception) -> str:
+    return f"# 《{book_title}》\n- 生成思维导图失败\n  - 错误信息: {error}"
+
+def _generate_mindmap_markdown(book_title: str, context: str) -> str:
     prompt = f"""
     请根据以下关于《{book_title}》的内容，生成一个内容详实、结构严谨的 Markdown 思维导图。
     要求：
@@ -101,24 +192,199 @@ def generate_mindmap_markdown(book_title: str, context: str) -> str:
     {context}
     """
 
+    content, _ = _chat(
+        "mindmap_markdown",
+        [book_title],
+        messages=[
+            {"role": "system", "content": "你是一个资深的图书讲解人和逻辑架构师。"},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.6,
+        max_tokens=2000,
+        validate=lambda c: _valid_mindmap(_strip_markdown_fence(c), book_title)
+    )
+    return _strip_markdown_fence(content)
+
+def _valid_quotes(quotes) -> bool:
+    return isinstance(quotes, list) and len(quotes) > 0 and all(isinstance(q, str) and q.strip() for q in quotes)
+
+def _extract_quotes_chunk(books: list[tuple[str, str]]) -> tuple[dict[str, list[str]], int]:
+    """
+    Extracts quotes for several books with a single DeepSeek request.
+    Returns the validated per-book results (books that came back missing or malformed
+    are left out) and the total tokens billed for the request.
+    """
+    sections = ""
+    for i, (book_title, context) in enumerate(books):
+        sections += f"【书籍{i + 1}】《{book_title}》\n搜索内容：\n{context}\n\n"
+
+    prompt = f"""
+    我需要你根据以下{len(books)}本书各自的搜索内容，分别为每本书提取10句书中的核心金句（必须深刻且有哲理，适合发朋友圈）。如果没有找到原著里足够的金句，请根据书本内容和作者观点，总结生成10个最符合原意的高质量金句。
+    每本书只能使用它自己的搜索内容，不要混用。
+
+    {sections}
+    必须严格按照JSON格式返回，包含一个字段 "books"，数组中每一项对应一本书，"index" 为书籍编号，"title" 为书名，"quotes" 为10句金句。
+    请只返回JSON数据，不要包含Markdown格式（如```json），也不要有任何多余的解释。
+    示例结构：
+    {{
+        "books": [
+            {{"index": 1, "title": "书名1", "quotes": ["金句1", "金句2", "...", "金句10"]}}
+        ]
+    }}
+    """
+
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
+        content, tokens = _chat(
+            "extract_quotes_batch",
+            [book_title for book_title, _ in books],
             messages=[
-                {"role": "system", "content": "你是一个资深的图书讲解人和逻辑架构师。"},
+                {"role": "system", "content": "你是一个专业的图书拆解专家和文案大师。"},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.6,
-            max_tokens=2000
+            temperature=0.7,
+            max_tokens=min(8000, 1500 * len(books)),
+            validate=_parses_as_json_object,
+            response_format={"type": "json_object"}
         )
-        content = response.choices[0].message.content.strip()
-        if content.startswith("```markdown"):
-            content = content[11:]
-        elif content.startswith("```"):
-            content = content[3:]
-        if content.endswith("```"):
-            content = content[:-3]
-        return content.strip()
+        result = json.loads(_strip_json_fence(content))
     except Exception as e:
-        print(f"Error generating mindmap: {e}")
-        return f"# 《{book_title}》\n- 生成思维导图失败\n  - 错误信息: {e}"
+        print(f"Error during batch LLM extraction: {e}")
+        return {}, 0
+
+    quotes_by_title = {}
+    for item in result.get("books", []) if isinstance(result, dict) else []:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("index")
+        if not isinstance(index, int) or not 1 <= index <= len(books):
+            continue
+        book_title = books[index - 1][0]
+        if _valid_quotes(item.get("quotes")):
+            quotes_by_title[book_title] = item["quotes"][:10]
+    return quotes_by_title, tokens
+
+def extract_quotes_batch(books: list[tuple[str, str]], batch_size: int = 5, max_workers: int = 4) -> dict[str, list[str]]:
+    """
+    Extracts quotes for many (book_title, context) pairs, packing `batch_size` books into
+    each DeepSeek request and running at most `max_workers` requests at once.
+    Books missing from or malformed in a batch response fall back to `extract_quotes`.
+    Returns a dict mapping each book title to its list of quotes.
+    """
+    return extract_quotes_batch_with_stats(books, batch_size, max_workers)[0]
+
+def extract_quotes_batch_with_stats(books: list[tuple[str, str]], batch_size: int = 5, max_workers: int = 4) -> tuple[dict[str, list[str]], dict]:
+    """
+    Same as `extract_quotes_batch`, additionally returning request/token counters
+    so callers (e.g. the batch CLI) can report tokens per book.
+    """
+    unique_books = list(dict((title, context) for title, context in books).items())
+    chunks = [unique_books[i:i + batch_size] for i in range(0, len(unique_books), max(1, batch_size))]
+
+    results = {}
+    stats = {"books": len(unique_books), "batch_requests": len(chunks), "batch_tokens": 0, "fallbacks": 0}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for quotes_by_title, tokens in executor.map(_extract_quotes_chunk, chunks):
+            results.update(quotes_by_title)
+            stats["batch_tokens"] += tokens
+
+        missing = [(title, context) for title, context in unique_books if title not in results]
+        stats["fallbacks"] = len(missing)
+        for (title, _), quotes in zip(missing, executor.map(lambda book: extract_quotes(*book), missing)):
+            results[title] = quotes
+
+    return results, stats
+
+def _valid_mindmap(markdown, book_title: str) -> bool:
+    if not isinstance(markdown, str) or not markdown.strip():
+        return False
+    try:
+        return parse_mindmap_markdown(markdown, root_title=f"《{book_title}》").count() > 1
+    except MindMapValidationError as e:
+        print(f"Invalid mind map from combined analysis: {e}")
+        return False
+
+def analyze_book(book_title: str, context: str) -> dict:
+    """
+    Generates quotes, core thought and mind map markdown for one book in a single
+    DeepSeek request, so the search context is only sent once.
+    Any artifact missing or malformed in the response is regenerated with its
+    dedicated function (extract_quotes / generate_core_thought / generate_mindmap_markdown).
+    Returns {"quotes": list[str], "core_thought": str, "mindmap_markdown": str, "fallback": bool};
+    "fallback" is True when any artifact is placeholder text from a failed LLM call.
+    """
+    prompt = f"""
+    我需要你根据以下关于《{book_title}》的搜索内容，一次性生成以下三部分信息。
+    必须严格按照JSON格式返回，包含三个字段：
+    1. "quotes": 一个数组，包含10句书中的核心金句（必须深刻且有哲理，适合发朋友圈）。如果没有找到原著里足够的金句，请根据书本内容和作者观点，总结生成10个最符合原意的高质量金句。
+    2. "core_thought": 一段约50字的短文，总结这本书最核心的价值观与思想境界，用于大模型生成背景纯净唯美、留白足够的插画配图。必须具象化，可以描述一种意境，不要有文字元素，适合做文字海报的背景。
+    3. "mindmap": 一个字符串，内容为详实、结构严谨的 Markdown 思维导图：
+       - 必须使用 Markdown 的多级列表语法（如 -, *, # 等）来表示层级关系，换行使用 \\n。
+       - 第一层级（根节点）必须是书名《{book_title}》。
+       - 后续层级应包括：作者背景、核心思想、主要内容/结构拆解、经典金句、实际应用或启示等维度。
+       - 深入展开细节，保持文字精炼且专业，适合“高端大气”的呈现样式。
+
+    搜索内容：
+    {context}
+
+    请只返回JSON数据，不要包含Markdown格式（如```json），也不要有任何多余的解释。
+    示例结构：
+    {{
+        "quotes": ["金句1", "金句2", "...", "金句10"],
+        "core_thought": "意境描述",
+        "mindmap": "# 《{book_title}》\\n## 作者背景\\n- ..."
+    }}
+    """
+
+    result = {}
+    try:
+        content, _ = _chat(
+            "analyze_book",
+            [book_title],
+            messages=[
+                {"role": "system", "content": "你是一个专业的图书拆解专家、文案大师和逻辑架构师。"},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=4000,
+            validate=_parses_as_json_object,
+            response_format={"type": "json_object"}
+        )
+        result = json.loads(_strip_json_fence(content))
+        if not isinstance(result, dict):
+            result = {}
+    except Exception as e:
+        print(f"Error during combined book analysis: {e}")
+
+    fallback = False
+
+    quotes = result.get("quotes")
+    if not _valid_quotes(quotes):
+        try:
+            quotes = _extract_quotes(book_title, context)
+        except Exception as e:
+            print(f"Error during LLM extraction: {e}")
+            quotes, fallback = _fallback_quotes(book_title), True
+
+    core_thought = result.get("core_thought")
+    if not isinstance(core_thought, str) or not core_thought.strip():
+        try:
+            core_thought = _generate_core_thought(book_title, context)
+        except Exception as e:
+            print(f"Error generating core thought: {e}")
+            core_thought, fallback = FALLBACK_CORE_THOUGHT, True
+
+    mindmap_markdown = result.get("mindmap")
+    if not _valid_mindmap(mindmap_markdown, book_title):
+        try:
+            mindmap_markdown = _generate_mindmap_markdown(book_title, context)
+        except Exception as e:
+            print(f"Error generating mindmap: {e}")
+            mindmap_markdown, fallback = _fallback_mindmap(book_title, e), True
+
+    return {
+        "quotes": quotes[:10],
+        "core_thought": core_thought.strip(),
+        "mindmap_markdown": _strip_markdown_fence(mindmap_markdown.strip()),
+        "fallback": fallback,
+    }
@@ -0,0 +1,305 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.sax.saxutils import escape
+
+from services.mindmap_tree import MindMapNode, parse_mindmap_markdown
+
+# Layout metrics in CSS pixels (scaled up for raster output)
+ROOT_FONT_SIZE = 22
+FONT_SIZE = 16
+LINE_HEIGHT = 1.4
+MAX_LABEL_WIDTH = 320
+H_GAP = 70
+V_GAP = 12
+PADDING = 60
+TEXT_PADDING = 6
+
+DARK_BACKGROUND = "#0f172a"
+DARK_TEXT = "#f8fafc"
+LIGHT_BACKGROUND = "#ffffff"
+LIGHT_TEXT = "#4b5563"
+# markmap's default branch palette (d3.schemeCategory10)
+BRANCH_COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"]
+
+# CJK fonts tried in order for the JPG: MINDMAP_FONT_PATH, a font dropped into
+# backend/fonts, then the system fonts from `apt install fonts-noto-cjk fonts-wqy-zenhei`
+FONT_CANDIDATES = [
+    path for path in (
+        os.environ.get("MINDMAP_FONT_PATH"),
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), "fonts", "NotoSansSC-Regular.otf"),
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+        "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    ) if path
+]
+RASTER_SCALE = 2
+# Flat-colour text maps compress well; this keeps even very large maps phone-friendly
+JPEG_TARGET_BYTES = 3 * 1024 * 1024
+RENDER_WORKERS = int(os.environ.get("MINDMAP_RENDER_WORKERS", "2"))
+
+class MindMapFontError(RuntimeError):
+    """No usable CJK font for the native JPG renderer."""
+
+def _load_font(size: int):
+    from PIL import ImageFont
+
+    errors = []
+    for path in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(path, size=size)
+        except Exception as e:
+            errors.append(f"{path}: {e}")
+    # PIL's default bitmap font has no CJK glyphs, so falling back to it would
+    # produce an unreadable map; let the caller switch renderers instead
+    raise MindMapFontError("No CJK font found (" + "; ".join(errors) + ")")
+
+class _Box:
+    __slots__ = ("title", "depth", "color", "font_size", "lines", "width", "height", "x", "y", "subtree_height", "children")
+
+    def __init__(self, title: str, depth: int, color: str):
+        self.title = title
+        self.depth = depth
+        self.color = color
+        self.font_size = ROOT_FONT_SIZE if depth == 0 else FONT_SIZE
+        self.lines = _wrap(title, self.font_size, MAX_LABEL_WIDTH)
+        self.width = max(_text_width(line, self.font_size) for line in self.lines) + TEXT_PADDING * 2
+        self.height = len(self.lines) * self.font_size * LINE_HEIGHT + TEXT_PADDING * 2
+        self.x = 0.0
+        self.y = 0.0
+        self.subtree_height = 0.0
+        self.children: list["_Box"] = []
+
+    @property
+    def bottom(self) -> float:
+        return self.y + self.height / 2
+
+def _char_width(ch: str, font_size: float) -> float:
+    # CJK glyphs are full-width in Noto Sans SC; Latin averages a little over half an em
+    return font_size if ord(ch) >= 0x2E80 else font_size * 0.56
+
+def _text_width(text: str, font_size: float) -> float:
+    return sum(_char_width(ch, font_size) for ch in text)
+
+def _wrap(text: str, font_size: float, max_width: float) -> list[str]:
+    lines, current, width = [], "", 0.0
+    for ch in text:
+        w = _char_width(ch, font_size)
+        if current and width + w > max_width:
+            lines.append(current)
+            current, width = "", 0.0
+        current += ch
+        width += w
+    lines.append(current)
+    return lines
+
+class MindMapLayout:
+    """
+    Left-to-right tidy tree: one column per depth sized to its widest label,
+    every parent vertically centered on the span of its children.
+    """
+
+    def __init__(self, root: MindMapNode):
+        self.root = self._build(root, 0, BRANCH_COLORS[0])
+        columns: dict[int, float] = {}
+        for box in self.boxes():
+            columns[box.depth] = max(columns.get(box.depth, 0.0), box.width)
+
+        column_x, x = {}, float(PADDING)
+        for depth in sorted(columns):
+            column_x[depth] = x
+            x += columns[depth] + H_GAP
+        for box in self.boxes():
+            box.x = column_x[box.depth]
+
+        self._measure(self.root)
+        self._place(self.root, float(PADDING))
+        self.width = x - H_GAP + PADDING
+        self.height = self.root.subtree_height + PADDING * 2
+
+    def _build(self, node: MindMapNode, depth: int, color: str) -> _Box:
+        box = _Box(node.plain_title, depth, color)
+        for i, child in enumerate(node.children):
+            child_color = BRANCH_COLORS[i % len(BRANCH_COLORS)] if depth == 0 else color
+            box.children.append(self._build(child, depth + 1, child_color))
+        return box
+
+    def _measure(self, box: _Box) -> float:
+        children_height = sum(self._measure(child) for child in box.children) + V_GAP * max(0, len(box.children) - 1)
+        box.subtree_height = max(box.height, children_height)
+        return box.subtree_height
+
+    def _place(self, box: _Box, top: float):
+        box.y = top + box.subtree_height / 2
+        children_height = sum(child.subtree_height for child in box.children) + V_GAP * max(0, len(box.children) - 1)
+        cursor = top + (box.subtree_height - children_height) / 2
+        for child in box.children:
+            self._place(child, cursor)
+            cursor += child.subtree_height + V_GAP
+
+    def boxes(self):
+        stack = [self.root]
+        while stack:
+            box = stack.pop()
+            yield box
+            stack.extend(box.children)
+
+    def edges(self):
+        for box in self.boxes():
+            for child in box.children:
+                yield box, child
+
+def _edge_points(parent: _Box, child: _Box) -> tuple[float, float, float, float, float, float, float, float]:
+    """Cubic bezier from the end of the parent's underline to the start of the child's."""
+    x0, y0 = parent.x + parent.width, parent.bottom
+    x3, y3 = child.x, child.bottom
+    mid = (x0 + x3) / 2
+    return x0, y0, mid, y0, mid, y3, x3, y3
+
+def _bezier(points, steps: int = 24) -> list[tuple[float, float]]:
+    x0, y0, x1, y1, x2, y2, x3, y3 = points
+    result = []
+    for i in range(steps + 1):
+        t = i / steps
+        a, b, c, d = (1 - t) ** 3, 3 * (1 - t) ** 2 * t, 3 * (1 - t) * t ** 2, t ** 3
+        result.append((a * x0 + b * x1 + c * x2 + d * x3, a * y0 + b * y1 + c * y2 + d * y3))
+    return result
+
+def _line_stroke(box: _Box) -> float:
+    return 3.0 if box.depth <= 1 else 1.5
+
+def render_svg(layout: MindMapLayout, background: str = DARK_BACKGROUND, text_color: str = DARK_TEXT) -> str:
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{layout.width:.0f}" height="{layout.height:.0f}" '
+        f'viewBox="0 0 {layout.width:.0f} {layout.height:.0f}" '
+        "font-family=\"'Noto Sans SC', 'PingFang SC', 'Microsoft YaHei', sans-serif\">",
+        f'<rect width="100%" height="100%" fill="{background}"/>',
+    ]
+    for parent, child in layout.edges():
+        x0, y0, x1, y1, x2, y2, x3, y3 = _edge_points(parent, child)
+        parts.append(
+            f'<path d="M{x0:.1f},{y0:.1f} C{x1:.1f},{y1:.1f} {x2:.1f},{y2:.1f} {x3:.1f},{y3:.1f}" '
+            f'fill="none" stroke="{child.color}" stroke-width="{_line_stroke(child)}"/>'
+        )
+    for box in layout.boxes():
+        top = box.y - box.height / 2 + TEXT_PADDING
+        parts.append(
+            f'<line x1="{box.x:.1f}" y1="{box.bottom:.1f}" x2="{box.x + box.width:.1f}" y2="{box.bottom:.1f}" '
+            f'stroke="{box.color}" stroke-width="{_line_stroke(box)}"/>'
+        )
+        for i, line in enumerate(box.lines):
+            baseline = top + (i + 0.8) * box.font_size * LINE_HEIGHT
+            weight = ' font-weight="bold"' if box.depth == 0 else ""
+            parts.append(
+                f'<text x="{box.x + TEXT_PADDING:.1f}" y="{baseline:.1f}" font-size="{box.font_size}" '
+                f'fill="{text_color}"{weight}>{escape(line)}</text>'
+            )
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+def render_jpg(layout: MindMapLayout, path: str, scale: int = RASTER_SCALE):
+    from PIL import Image, ImageDraw
+    from services.rendition_service import save_jpeg_for_target
+
+    fonts = {size: _load_font(size * scale) for size in {box.font_size for box in layout.boxes()}}
+    image = Image.new("RGB", (int(layout.width * scale), int(layout.height * scale)), DARK_BACKGROUND)
+    draw = ImageDraw.Draw(image)
+
+    for parent, child in layout.edges():
+        points = [(x * scale, y * scale) for x, y in _bezier(_edge_points(parent, child))]
+        draw.line(points, fill=child.color, width=int(_line_stroke(child) * scale), joint="curve")
+    for box in layout.boxes():
+        draw.line(
+            [(box.x * scale, box.bottom * scale), ((box.x + box.width) * scale, box.bottom * scale)],
+            fill=box.color, width=int(_line_stroke(box) * scale),
+        )
+        top = box.y - box.height / 2 + TEXT_PADDING
+        for i, line in enumerate(box.lines):
+            y = top + i * box.font_size * LINE_HEIGHT
+            draw.text(((box.x + TEXT_PADDING) * scale, y * scale), line, font=fonts[box.font_size], fill=DARK_TEXT)
+
+    save_jpeg_for_target(image, path, JPEG_TARGET_BYTES)
+
+def render_pdf(layout: MindMapLayout, path: str):
+    """Vector PDF on a page sized to the map, light print theme like the Puppeteer export."""
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+
+    # Built-in CID font: no font embedding, keeps the PDF small
+    pdfmetrics.registerFont(UnicodeCIDFont("STSong-Light"))
+    pdf = canvas.Canvas(path, pagesize=(layout.width, layout.height))
+    height = layout.height
+
+    pdf.setFillColor(LIGHT_BACKGROUND)
+    pdf.rect(0, 0, layout.width, layout.height, stroke=0, fill=1)
+
+    for parent, child in layout.edges():
+        x0, y0, x1, y1, x2, y2, x3, y3 = _edge_points(parent, child)
+        pdf.setStrokeColor(child.color)
+        pdf.setLineWidth(_line_stroke(child))
+        pdf.bezier(x0, height - y0, x1, height - y1, x2, height - y2, x3, height - y3)
+    pdf.setFillColor(LIGHT_TEXT)
+    for box in layout.boxes():
+        pdf.setStrokeColor(box.color)
+        pdf.setLineWidth(_line_stroke(box))
+        pdf.line(box.x, height - box.bottom, box.x + box.width, height - box.bottom)
+        pdf.setFont("STSong-Light", box.font_size)
+        top = box.y - box.height / 2 + TEXT_PADDING
+        for i, line in enumerate(box.lines):
+            baseline = top + (i + 0.8) * box.font_size * LINE_HEIGHT
+            pdf.drawString(box.x + TEXT_PADDING, height - baseline, line)
+
+    pdf.showPage()
+    pdf.save()
+
+def render_mindmap_files(markdown_content: str, root_title: str, jpg_path: str = None, pdf_path: str = None, svg_path: str = None):
+    """
+    Parses the markdown, lays it out once and writes whichever of SVG / JPG / PDF were requested.
+    """
+    layout = MindMapLayout(parse_mindmap_markdown(markdown_content, root_title=root_title))
+    if svg_path:
+        with open(svg_path, "w", encoding="utf-8") as f:
+            f.write(render_svg(layout))
+    if jpg_path:
+        render_jpg(layout, jpg_path)
+    if pdf_path:
+        render_pdf(layout, pdf_path)
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def _get_render_pool(broken: ProcessPoolExecutor | None = None) -> ProcessPoolExecutor:
+    """Returns the shared pool, replacing it if it is `broken` (a worker process died)."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None and _render_pool is broken:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+            _render_pool = None
+        if _render_pool is None:
+            # Forking the API worker after its LLM/anyio threads have started can deadlock
+            # the child; forkserver starts workers from a clean single-threaded process
+            _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+        return _render_pool
+
+def render_mindmap_files_in_pool(markdown_content: str, root_title: str, jpg_path: str = None, pdf_path: str = None, svg_path: str = None):
+    """
+    Same as render_mindmap_files, run in a small process pool so CPU-bound
+    rasterization doesn't hold the GIL of the API worker.
+    """
+    pool = _get_render_pool()
+    try:
+        pool.submit(render_mindmap_files, markdown_content, root_title, jpg_path, pdf_path, svg_path).result()
+    except BrokenProcessPool:
+        # A crashed worker poisons the whole pool; start a fresh one and retry once
+        print("Mind map render pool broken, restarting it")
+        _get_render_pool(broken=pool).submit(render_mindmap_files, markdown_content, root_title, jpg_path, pdf_path, svg_path).result()
+
+def shutdown_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+            _render_pool = None
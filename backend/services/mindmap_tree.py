@@ -0,0 +1,230 @@
+import json
+import re
+import time
+import uuid
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+MAX_DEPTH = 8
+MAX_NODES = 500
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+_LIST_RE = re.compile(r"^([ \t]*)(?:[-*+]|\d+[.)])\s+(.*)$")
+_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_EMPHASIS_RE = re.compile(r"(\*\*|__|\*|_|`|~~)(.+?)\1")
+
+class MindMapValidationError(ValueError):
+    pass
+
+class MindMapNode:
+    __slots__ = ("title", "children")
+
+    def __init__(self, title: str, children: list["MindMapNode"] | None = None):
+        self.title = title
+        self.children = children or []
+
+    @property
+    def plain_title(self) -> str:
+        """Title with inline markdown (bold, code, links) removed, for XMind/OPML."""
+        text = _LINK_RE.sub(r"\1", self.title)
+        return _EMPHASIS_RE.sub(r"\2", text).strip()
+
+    def count(self) -> int:
+        return 1 + sum(child.count() for child in self.children)
+
+    def depth(self) -> int:
+        return 1 + max((child.depth() for child in self.children), default=0)
+
+class MindMapParser:
+    """
+    Incremental parser for the LLM's mind map output (headings and nested lists).
+    Feed text as it arrives with `feed()`, then call `close()` for the tree.
+    Raises MindMapValidationError when the tree is empty, too deep or too large.
+    """
+
+    def __init__(self, root_title: str = "思维导图", max_depth: int = MAX_DEPTH, max_nodes: int = MAX_NODES):
+        self.root_title = root_title
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self._buffer = ""
+        self._top: list[MindMapNode] = []
+        # (level, node) pairs for the current path; headings use levels 1-6,
+        # list items nest below the heading they follow
+        self._stack: list[tuple[int, MindMapNode]] = []
+        self._heading_level = 0
+        # Indent widths of the open list levels below the current heading, so mixed
+        # 4-space/2-space nesting still resolves to the right parent
+        self._indents: list[int] = []
+        self._nodes = 0
+
+    def feed(self, chunk: str):
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            self._parse_line(line)
+
+    def close(self) -> MindMapNode:
+        if self._buffer:
+            self._parse_line(self._buffer)
+            self._buffer = ""
+        if not self._top:
+            raise MindMapValidationError("Mind map is empty")
+        root = self._top[0] if len(self._top) == 1 else MindMapNode(self.root_title, self._top)
+        depth = root.depth()
+        if depth > self.max_depth:
+            raise MindMapValidationError(f"Mind map is {depth} levels deep, limit is {self.max_depth}")
+        return root
+
+    def _parse_line(self, line: str):
+        line = line.rstrip()
+        # The LLM sometimes wraps the whole map in a code fence; drop the fence lines
+        if not line.strip() or line.lstrip().startswith("```"):
+            return
+
+        heading = _HEADING_RE.match(line.strip())
+        if heading:
+            level = len(heading.group(1))
+            self._heading_level = level
+            self._indents = []
+            self._add(level, heading.group(2))
+            return
+
+        item = _LIST_RE.match(line)
+        if item:
+            indent = len(item.group(1).replace("\t", "    "))
+            while self._indents and indent < self._indents[-1]:
+                self._indents.pop()
+            if not self._indents or indent > self._indents[-1]:
+                self._indents.append(indent)
+            self._add(self._heading_level + len(self._indents), item.group(2))
+            return
+
+        # Prose before the first heading or list item is a preamble
+        # ("以下是《X》的思维导图："), not part of the map
+        if not self._top:
+            return
+        # Plain paragraph text becomes a leaf under the current node
+        parent_level = self._stack[-1][0] if self._stack else 0
+        self._add(parent_level + 1, line.strip())
+
+    def _add(self, level: int, title: str):
+        title = title.strip().rstrip("#").strip()
+        if not title:
+            return
+        self._nodes += 1
+        if self._nodes > self.max_nodes:
+            raise MindMapValidationError(f"Mind map has more than {self.max_nodes} nodes")
+
+        node = MindMapNode(title)
+        while self._stack and self._stack[-1][0] >= level:
+            self._stack.pop()
+        if self._stack:
+            self._stack[-1][1].children.append(node)
+        else:
+            self._top.append(node)
+        self._stack.append((level, node))
+
+def parse_mindmap_markdown(markdown: str, root_title: str = "思维导图", max_depth: int = MAX_DEPTH, max_nodes: int = MAX_NODES) -> MindMapNode:
+    parser = MindMapParser(root_title, max_depth, max_nodes)
+    parser.feed(markdown)
+    return parser.close()
+
+# -- Serializers --
+
+def to_markdown(root: MindMapNode) -> str:
+    """Root and first level as headings, deeper levels as nested lists (markmap-friendly)."""
+    lines = [f"# {root.title}"]
+
+    def walk(node: MindMapNode, depth: int):
+        for child in node.children:
+            if depth == 0:
+                lines.append(f"\n## {child.title}")
+            else:
+                lines.append(f"{'  ' * (depth - 1)}- {child.title}")
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return "\n".join(lines) + "\n"
+
+def to_markmap_json(root: MindMapNode) -> str:
+    def convert(node: MindMapNode, depth: int) -> dict:
+        return {
+            "content": node.title,
+            "depth": depth,
+            "children": [convert(child, depth + 1) for child in node.children],
+        }
+
+    return json.dumps(convert(root, 0), ensure_ascii=False)
+
+def to_opml(root: MindMapNode) -> str:
+    """OPML 2.0 outline; MindManager, XMind and most outliners import it."""
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<opml version="2.0">',
+        f"  <head><title>{escape(root.plain_title)}</title></head>",
+        "  <body>",
+    ]
+
+    def walk(node: MindMapNode, indent: int):
+        pad = "  " * indent
+        if node.children:
+            lines.append(f"{pad}<outline text={quoteattr(node.plain_title)}>")
+            for child in node.children:
+                walk(child, indent + 1)
+            lines.append(f"{pad}</outline>")
+        else:
+            lines.append(f"{pad}<outline text={quoteattr(node.plain_title)}/>")
+
+    walk(root, 2)
+    lines += ["  </body>", "</opml>"]
+    return "\n".join(lines) + "\n"
+
+def _xmind_content_json(root: MindMapNode) -> str:
+    def convert(node: MindMapNode) -> dict:
+        topic = {"id": uuid.uuid4().hex, "title": node.plain_title}
+        if node.children:
+            topic["children"] = {"attached": [convert(child) for child in node.children]}
+        return topic
+
+    sheet = {
+        "id": uuid.uuid4().hex,
+        "class": "sheet",
+        "title": root.plain_title,
+        "rootTopic": {**convert(root), "class": "topic", "structureClass": "org.xmind.ui.map.unbalanced"},
+    }
+    return json.dumps([sheet], ensure_ascii=False)
+
+def _xmind_content_xml(root: MindMapNode) -> str:
+    # Legacy XMind 8 format, read by MindManager's XMind importer and old XMind versions
+    def convert(node: MindMapNode) -> str:
+        children = ""
+        if node.children:
+            children = '<children><topics type="attached">' + "".join(convert(child) for child in node.children) + "</topics></children>"
+        return f'<topic id="{uuid.uuid4().hex}"><title>{escape(node.plain_title)}</title>{children}</topic>'
+
+    timestamp = int(time.time() * 1000)
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
+        '<xmap-content xmlns="urn:xmind:xmap:xmlns:content:2.0" version="2.0" '
+        f'timestamp="{timestamp}"><sheet id="{uuid.uuid4().hex}"><title>{escape(root.plain_title)}</title>'
+        f"{convert(root)}</sheet></xmap-content>"
+    )
+
+def write_xmind(root: MindMapNode, path: str):
+    """Writes a native .xmind archive (XMind Zen content.json plus legacy content.xml)."""
+    manifest = {"file-entries": {"content.json": {}, "content.xml": {}, "metadata.json": {}}}
+    metadata = {"creator": {"name": "BookQuoteApp"}}
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("content.json", _xmind_content_json(root))
+        zf.writestr("content.xml", _xmind_content_xml(root))
+        zf.writestr("metadata.json", json.dumps(metadata))
+        zf.writestr("manifest.json", json.dumps(manifest))
+        zf.writestr(
+            "META-INF/manifest.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
+            '<manifest xmlns="urn:xmind:xmap:xmlns:manifest:1.0">'
+            '<file-entry full-path="content.xml" media-type="text/xml"/>'
+            '<file-entry full-path="META-INF/" media-type=""/>'
+            '<file-entry full-path="META-INF/manifest.xml" media-type="text/xml"/>'
+            "</manifest>",
+        )
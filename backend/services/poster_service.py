@@ -1,14 +1,19 @@
+import asyncio
 import os
-from PIL import Image, ImageDraw, ImageFont
-import httpx
 import io
 import textwrap
 
-async def create_poster_image(book_title: str, texts: list[str], bg_image_url: str = None) -> str:
+async def create_poster_image(book_title: str, texts: list[str], bg_image_url: str = None) -> tuple[str, dict]:
     """
     Downloads the background image (or uses a beige solid color), nicely overlays the quotes 
-    and book title, saves the poster locally (in a 'static' dir), and returns the local file path/URL.
+    and book title, saves the poster locally (in a 'static' dir) as thumbnail/mobile/print renditions,
+    and returns the print JPG's local file path/URL plus the rendition URLs.
     """
+    # Heavy imaging/HTTP libraries are loaded on first use to keep worker startup fast
+    from PIL import Image, ImageDraw, ImageFont
+    import httpx
+    from services.rendition_service import save_renditions
+    from services.book_index_service import resolve_book
     
     base_dir = os.path.dirname(os.path.dirname(__file__))
     width, height = 1024, 1024
@@ -105,9 +110,8 @@ async def create_poster_image(book_title: str, texts: list[str], bg_image_url: s
     os.makedirs(static_dir, exist_ok=True)
     
     import time
-    filename = f"poster_{book_title.replace(' ', '_')}_{int(time.time())}.jpg"
-    file_path = os.path.join(static_dir, filename)
+    stem = f"poster_{resolve_book(book_title).canonical_id}_{int(time.time())}"
+    # Encoding several sizes and formats is CPU-bound; keep it off the event loop
+    renditions = await asyncio.to_thread(save_renditions, composite, static_dir, stem)
     
-    composite.save(file_path, "JPEG", quality=95)
-    
-    return f"/static/{filename}"
+    return renditions["print"]["jpg"], renditions
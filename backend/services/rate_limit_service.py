@@ -0,0 +1,247 @@
+import asyncio
+import datetime
+import ipaddress
+import os
+import threading
+import time
+from fastapi import HTTPException, Request
+
+RATE_LIMIT_SHARDS = 16
+# Generation endpoints: sustained requests per minute and burst size, per client IP / per H5 user
+IP_RATE_PER_MINUTE = float(os.environ.get("RATE_LIMIT_IP_PER_MIN", "20"))
+IP_BURST = float(os.environ.get("RATE_LIMIT_IP_BURST", "10"))
+USER_RATE_PER_MINUTE = float(os.environ.get("RATE_LIMIT_USER_PER_MIN", "10"))
+USER_BURST = float(os.environ.get("RATE_LIMIT_USER_BURST", "5"))
+USAGE_FLUSH_INTERVAL_SECONDS = 5
+USAGE_REFRESH_CHUNK = 500
+
+# Only these peers may set X-Forwarded-For (nginx on the same box by default)
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(p.strip(), strict=False)
+    for p in os.environ.get("TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if p.strip()
+]
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+def client_ip(request: Request) -> str:
+    """
+    The client's IP address. X-Forwarded-For is only honoured when the direct peer is
+    a trusted proxy, and is walked right-to-left past any further trusted proxies so
+    a client can't spoof its address by sending the header itself.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if not _is_trusted_proxy(peer):
+        return peer
+    forwarded = request.headers.get("X-Forwarded-For")
+    if not forwarded:
+        return peer
+    for hop in reversed([h.strip() for h in forwarded.split(",") if h.strip()]):
+        if not _is_trusted_proxy(hop):
+            return hop
+    return peer
+
+class _Shard:
+    __slots__ = ("lock", "items")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}
+
+class TokenBucketLimiter:
+    """
+    Token buckets held in lock-striped shards so concurrent checks for different
+    keys rarely contend. A check is a dict lookup and a few float operations.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: float, shards: int = RATE_LIMIT_SHARDS):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def check(self, key, cost: float = 1.0) -> float:
+        """Consumes `cost` tokens for `key`. Returns 0.0 if allowed, else seconds until it would be."""
+        now = time.monotonic()
+        shard = self._shards[hash(key) % len(self._shards)]
+        with shard.lock:
+            bucket = shard.items.get(key)
+            tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            if tokens >= cost:
+                shard.items[key] = (tokens - cost, now)
+                return 0.0
+            shard.items[key] = (tokens, now)
+            return (cost - tokens) / self.rate
+
+    def prune(self):
+        """Drops buckets that have refilled completely; they behave exactly like absent ones."""
+        now = time.monotonic()
+        for shard in self._shards:
+            with shard.lock:
+                full = [k for k, (tokens, ts) in shard.items.items() if tokens + (now - ts) * self.rate >= self.burst]
+                for key in full:
+                    del shard.items[key]
+
+class DailyUsageCounter:
+    """
+    Per-IP daily free-tier usage, kept in sharded memory and flushed to the IPLog
+    table every few seconds instead of hitting SQLite on every request. Each flush
+    also re-reads today's counts, so usage granted by other worker processes is
+    seen within one flush interval.
+    """
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS):
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def _entry(self, ip: str, day: datetime.date) -> tuple[_Shard, list]:
+        """Returns the shard and its [count in the database, pending delta] entry for the IP."""
+        shard = self._shard(ip)
+        with shard.lock:
+            entry = shard.items.get((ip, day))
+        if entry is None:
+            # Load outside the lock so other IPs in the shard aren't blocked on SQLite
+            base = self._load([ip], day).get(ip, 0)
+            with shard.lock:
+                entry = shard.items.setdefault((ip, day), [base, 0])
+        return shard, entry
+
+    def _load(self, ips: list[str], day: datetime.date) -> dict[str, int]:
+        from sqlalchemy import func
+        from database import SessionLocal
+        import models
+
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(models.IPLog.ip_address, func.sum(models.IPLog.usage_count))
+                .filter(models.IPLog.ip_address.in_(ips), models.IPLog.date == day)
+                .group_by(models.IPLog.ip_address)
+                .all()
+            )
+            return {ip: int(count or 0) for ip, count in rows}
+        finally:
+            db.close()
+
+    def _shard(self, ip: str) -> _Shard:
+        return self._shards[hash(ip) % len(self._shards)]
+
+    def used(self, ip: str) -> int:
+        shard, entry = self._entry(ip, datetime.date.today())
+        with shard.lock:
+            return entry[0] + entry[1]
+
+    def try_consume(self, ip: str, limit: int) -> bool:
+        shard, entry = self._entry(ip, datetime.date.today())
+        with shard.lock:
+            if entry[0] + entry[1] >= limit:
+                return False
+            entry[1] += 1
+            return True
+
+    def refund(self, ip: str):
+        shard, entry = self._entry(ip, datetime.date.today())
+        with shard.lock:
+            entry[1] -= 1
+
+    def flush(self):
+        today = datetime.date.today()
+        pending = []
+        for shard in self._shards:
+            with shard.lock:
+                for key, entry in list(shard.items.items()):
+                    if entry[1]:
+                        pending.append((key, entry[1]))
+                        entry[0] += entry[1]
+                        entry[1] = 0
+                    elif key[1] < today:
+                        del shard.items[key]
+        if pending:
+            self._write(pending)
+        self._refresh(today)
+
+    def _refresh(self, day: datetime.date):
+        """Replaces the database part of each of today's entries with the current table value."""
+        ips = [key[0] for shard in self._shards for key in list(shard.items) if key[1] == day]
+        for i in range(0, len(ips), USAGE_REFRESH_CHUNK):
+            chunk = ips[i:i + USAGE_REFRESH_CHUNK]
+            try:
+                counts = self._load(chunk, day)
+            except Exception as e:
+                print(f"Error refreshing IP usage: {e}")
+                return
+            for ip in chunk:
+                shard = self._shard(ip)
+                with shard.lock:
+                    entry = shard.items.get((ip, day))
+                    if entry is not None:
+                        entry[0] = counts.get(ip, 0)
+
+    def _write(self, pending: list):
+        from sqlalchemy import func
+        from database import SessionLocal
+        import models
+
+        db = SessionLocal()
+        try:
+            for (ip, day), delta in pending:
+                # Atomic increment of a single row (duplicates from concurrent first
+                # inserts are summed on read): other workers flush the same IP concurrently
+                first_row = (
+                    db.query(func.min(models.IPLog.id))
+                    .filter(models.IPLog.ip_address == ip, models.IPLog.date == day)
+                    .scalar_subquery()
+                )
+                updated = (
+                    db.query(models.IPLog)
+                    .filter(models.IPLog.id == first_row)
+                    .update({models.IPLog.usage_count: models.IPLog.usage_count + delta}, synchronize_session=False)
+                )
+                if not updated:
+                    db.add(models.IPLog(ip_address=ip, date=day, usage_count=delta))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error flushing IP usage: {e}")
+            # Put the deltas back so the next flush retries them
+            for (ip, day), delta in pending:
+                shard = self._shard(ip)
+                with shard.lock:
+                    entry = shard.items.setdefault((ip, day), [0, 0])
+                    entry[0] -= delta
+                    entry[1] += delta
+        finally:
+            db.close()
+
+ip_limiter = TokenBucketLimiter(IP_RATE_PER_MINUTE, IP_BURST)
+user_limiter = TokenBucketLimiter(USER_RATE_PER_MINUTE, USER_BURST)
+daily_usage = DailyUsageCounter()
+
+def enforce_rate_limit(limiter: TokenBucketLimiter, key, cost: float = 1.0):
+    if cost > limiter.burst:
+        # Could never be admitted; capping the cost instead would let one request buy unlimited work
+        raise HTTPException(status_code=413, detail="Request too large, please split it into smaller batches.")
+    retry_after = limiter.check(key, cost)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please slow down.",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+async def rate_limit_ip(request: Request):
+    """FastAPI dependency: rejects with 429 before any search or LLM work starts."""
+    enforce_rate_limit(ip_limiter, client_ip(request))
+
+async def usage_flush_loop(interval: int = USAGE_FLUSH_INTERVAL_SECONDS):
+    """Background task: flushes free-tier counters and prunes idle buckets."""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(daily_usage.flush)
+            ip_limiter.prune()
+            user_limiter.prune()
+    finally:
+        daily_usage.flush()
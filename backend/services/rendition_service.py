@@ -0,0 +1,104 @@
+import io
+import os
+import warnings
+from PIL import Image, features
+
+# name -> (max width in px, target bytes for the JPEG rendition)
+RENDITIONS = {
+    "thumbnail": (320, 30 * 1024),
+    "mobile": (1080, 200 * 1024),
+    "print": (None, 1500 * 1024),
+}
+MIN_QUALITY = 45
+MAX_QUALITY = 90
+START_QUALITY = 80
+QUALITY_STEP = 10
+MAX_ENCODE_ATTEMPTS = 3
+# AVIF is slow to encode, so it gets one pass at a fixed quality instead of a search
+AVIF_QUALITY = 55
+
+def _supports(feature: str) -> bool:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        try:
+            return bool(features.check(feature))
+        except Exception:
+            return False
+
+# Modern formats are only emitted when this Pillow build can encode them
+EXTRA_FORMATS = [fmt for fmt in ("webp", "avif") if _supports(fmt)]
+
+_SAVE_ARGS = {
+    "jpg": lambda quality: {"format": "JPEG", "quality": quality, "progressive": True, "optimize": True},
+    "webp": lambda quality: {"format": "WEBP", "quality": quality, "method": 4},
+    "avif": lambda quality: {"format": "AVIF", "quality": quality},
+}
+# WebP/AVIF reach JPEG's visual quality at a fraction of the size
+_TARGET_RATIO = {"jpg": 1.0, "webp": 0.7, "avif": 0.5}
+
+# Quality each (format, byte budget) last settled on. Posters are similar enough
+# that the next one usually fits at the same quality in a single encode.
+_start_quality: dict[tuple[str, int], int] = {}
+
+def _encode(image: Image.Image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, **_SAVE_ARGS[fmt](quality))
+    return buffer.getvalue()
+
+def encode_for_target(image: Image.Image, fmt: str, target_bytes: int) -> bytes:
+    """
+    Encodes `image` to fit in `target_bytes`, starting from the quality that last
+    worked for this format and budget and stepping down at most MAX_ENCODE_ATTEMPTS
+    times (the last attempt at MIN_QUALITY). AVIF is encoded once at AVIF_QUALITY.
+    """
+    if fmt == "avif":
+        return _encode(image, fmt, AVIF_QUALITY)
+
+    key = (fmt, target_bytes)
+    quality = _start_quality.get(key, START_QUALITY)
+    for attempt in range(MAX_ENCODE_ATTEMPTS):
+        if attempt == MAX_ENCODE_ATTEMPTS - 1:
+            quality = MIN_QUALITY
+        data = _encode(image, fmt, quality)
+        if len(data) <= target_bytes or quality == MIN_QUALITY:
+            break
+        quality = max(MIN_QUALITY, quality - QUALITY_STEP)
+    # Drift back up when there was plenty of room, so one large image doesn't
+    # pin every later encode at a low quality
+    if len(data) < target_bytes * 0.7:
+        _start_quality[key] = min(MAX_QUALITY, quality + QUALITY_STEP // 2)
+    else:
+        _start_quality[key] = quality
+    return data
+
+def save_jpeg_for_target(image: Image.Image, path: str, target_bytes: int = RENDITIONS["print"][1]):
+    """Writes a progressive JPEG no larger than `target_bytes` where the quality floor allows."""
+    with open(path, "wb") as f:
+        f.write(encode_for_target(image.convert("RGB"), "jpg", target_bytes))
+
+def save_renditions(image: Image.Image, static_dir: str, stem: str) -> dict[str, dict[str, str]]:
+    """
+    Saves thumbnail / mobile / print renditions of `image` as progressive JPEG plus
+    WebP/AVIF when supported, each at a quality chosen to meet its byte budget.
+    Returns {"thumbnail": {"jpg": "/static/...", "webp": ...}, "mobile": {...}, "print": {...}}.
+    """
+    image = image.convert("RGB")
+    renditions = {}
+    for name, (max_width, target_bytes) in RENDITIONS.items():
+        resized = image
+        if max_width and image.width > max_width:
+            resized = image.resize((max_width, round(image.height * max_width / image.width)), Image.Resampling.LANCZOS)
+
+        urls = {}
+        for fmt in ["jpg"] + EXTRA_FORMATS:
+            filename = f"{stem}.{fmt}" if name == "print" else f"{stem}_{name}.{fmt}"
+            try:
+                data = encode_for_target(resized, fmt, int(target_bytes * _TARGET_RATIO[fmt]))
+            except Exception as e:
+                print(f"Error encoding {fmt} rendition: {e}")
+                continue
+            with open(os.path.join(static_dir, filename), "wb") as f:
+                f.write(data)
+            urls[fmt] = f"/static/{filename}"
+        renditions[name] = urls
+    return renditions
@@ -1,24 +1,50 @@
-from duckduckgo_search import DDGS
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from services.context_service import distill_context
 
 warnings.filterwarnings("ignore", category=RuntimeWarning, module="duckduckgo_search")
 
+def _search_queries(book_title: str) -> list[str]:
+    return [
+        f"《{book_title}》书籍 内容简介 作者核心观点 金句",
+        f"《{book_title}》经典语录 摘抄",
+        f"《{book_title}》读后感 核心思想",
+    ]
+
+def _run_query(query: str, max_results: int) -> list[dict]:
+    # Imported lazily: duckduckgo_search pulls in a large HTTP stack at import time
+    from duckduckgo_search import DDGS
+
+    try:
+        # One client per query, since queries run on separate threads
+        with DDGS() as ddgs:
+            return [{"title": r.get("title", ""), "body": r.get("body", "")}
+                    for r in ddgs.text(query, max_results=max_results) or []]
+    except Exception as e:
+        print(f"Error during search query '{query}': {e}")
+        return []
+
+def search_book_results(book_title: str, max_results: int = 5) -> list[dict]:
+    """
+    Runs several search queries for the book concurrently and returns the merged
+    raw results as a list of {"title", "body"} dicts, in query order.
+    """
+    queries = _search_queries(book_title)
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        batches = list(executor.map(lambda query: _run_query(query, max_results), queries))
+    return [r for batch in batches for r in batch]
+
 def search_book_info(book_title: str) -> str:
     """
     Searches the web for information about the given book.
-    Returns a concatenated string of search results.
+    Returns a deduplicated, relevance-ranked context string capped to the prompt token budget.
     """
-    query = f"《{book_title}》书籍 内容简介 作者核心观点 金句"
-    
-    results_text = ""
     try:
-        with DDGS() as ddgs:
-            # Get up to 5 results
-            results = ddgs.text(query, max_results=5)
-            for r in results:
-                title = r.get("title", "")
-                body = r.get("body", "")
-                results_text += f"Title: {title}\nSummary: {body}\n\n"
+        results = search_book_results(book_title)
+        results_text = distill_context(book_title, results)
+        if not results_text:
+            results_text = f"Could not find web search results for {book_title}."
     except Exception as e:
         print(f"Error during search: {e}")
         # Return a fallback or empty text if search fails
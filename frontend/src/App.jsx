@@ -126,12 +126,19 @@ function App() {
 
       const data = await response.json()
 
+      const toFullUrl = (url) => url.startsWith('http')
+        ? url
+        : (import.meta.env.DEV ? `http://localhost:8000${url}` : url)
+
       if (data.poster_url) {
-        data.poster_url = data.poster_url.startsWith('http')
-          ? data.poster_url
-          : (import.meta.env.DEV ? `http://localhost:8000${data.poster_url}` : data.poster_url)
+        data.poster_url = toFullUrl(data.poster_url)
       }
 
+      // Preview with the lighter mobile rendition; downloads keep the print-size poster
+      const mobile = data.renditions?.mobile
+      const previewUrl = mobile?.webp || mobile?.jpg
+      data.preview_url = previewUrl ? toFullUrl(previewUrl) : data.poster_url
+
       setResult(data)
       setStep(3)
     } catch (err) {
@@ -279,7 +286,7 @@ function App() {
               {/* Poster Preview */}
               <div className="poster-preview" style={{ background: result.image_url ? 'rgba(0,0,0,0.3)' : '#f5f5dc' }}>
                 {result.poster_url ? (
-                  <img src={result.poster_url} alt="Generated Book Quote Poster" className="poster-image" />
+                  <img src={result.preview_url || result.poster_url} alt="Generated Book Quote Poster" className="poster-image" />
                 ) : (
                   <div className="placeholder-image">Failed to load poster.</div>
                 )}
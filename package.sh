@@ -35,6 +35,7 @@ TAR_FILE="BookQuoteApp_Release.tar.gz"
 tar --exclude='backend/venv' \
     --exclude='backend/__pycache__' \
     --exclude='backend/app.db' \
+    --exclude='backend/llm_cache.db*' \
     --exclude='backend/.env' \
     --exclude='backend/static/*' \
     --exclude='frontend/node_modules' \